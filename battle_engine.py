@@ -0,0 +1,997 @@
+import random
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+import numpy as np
+import logging
+from battle_log import logger, muted
+from observer import BattleObserver # re-exported, observers import it from here
+
+# Allegiance names are stored as small integer codes in the unit table.
+ALLEGIANCES = ["player", "enemy"]
+
+# Skill effect types that target the user's own side; every other type targets hostile units.
+FRIENDLY_EFFECTS = ("buff", "heal")
+
+def distance(start_x, start_y, end_x, end_y):
+    # Manhattan distance, the metric for movement, attack and skill ranges
+    return abs(start_x - end_x) + abs(start_y - end_y)
+
+@lru_cache(maxsize=None)
+def range_offsets(range_value):
+    """Offsets (dx, dy) of the diamond |dx| + |dy| <= range_value, cached per range."""
+    span = np.arange(-range_value, range_value + 1)
+    dx, dy = np.meshgrid(span, span, indexing="ij")
+    inside = np.abs(dx) + np.abs(dy) <= range_value
+    dx, dy = dx[inside], dy[inside]
+    dx.setflags(write=False)
+    dy.setflags(write=False)
+    return dx, dy
+
+# Zobrist hashing: every state feature (a unit on a cell, its HP bucket, each
+# action flag, each skill cooldown, the side acting) has a 64-bit key and the
+# position hash is the XOR of the keys of the features present, updated
+# incrementally as features change. HP values are hashed in buckets of
+# HP_BUCKET; raise it to treat states that differ only slightly in HP as equal.
+HP_BUCKET = 1
+HASH_CELL, HASH_HP, HASH_MOVED, HASH_ATTACKED, HASH_COOLDOWN, HASH_SIDE = range(6)
+MASK64 = (1 << 64) - 1
+
+def zobrist_key(kind, index, value):
+    """Key of one feature: the splitmix64 mix of its id, so it is the same in every process."""
+    key = ((((index << 3) | kind) << 32) ^ (value & 0xFFFFFFFF)) + 0x9E3779B97F4A7C15 & MASK64
+    key = (key ^ (key >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    key = (key ^ (key >> 27)) * 0x94D049BB133111EB & MASK64
+    return key ^ (key >> 31)
+
+def zobrist_xor(kind, indices, values):
+    # XOR of zobrist_key(kind, i, v) over paired arrays, using wrapping uint64 arithmetic
+    if len(indices) < 32: # a plain loop beats the array setup for a few keys
+        code = 0
+        values = [values] * len(indices) if np.isscalar(values) else np.asarray(values).tolist()
+        for index, value in zip(np.asarray(indices).tolist(), values):
+            code ^= zobrist_key(kind, index, int(value))
+        return code
+    indices = np.asarray(indices, dtype=np.uint64)
+    values = (np.asarray(values, dtype=np.int64) & 0xFFFFFFFF).astype(np.uint64)
+    key = (((indices << np.uint64(3)) | np.uint64(kind)) << np.uint64(32)) ^ values
+    key = key + np.uint64(0x9E3779B97F4A7C15)
+    key = (key ^ (key >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    key = (key ^ (key >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    key ^= key >> np.uint64(31)
+    return int(np.bitwise_xor.reduce(key))
+
+UNMEASURED = nullcontext() # what BattleMap.measure() returns while no metrics are attached
+
+def allegiance_code(allegiance):
+    # Map an allegiance name to its table code, registering new names on first use
+    if allegiance not in ALLEGIANCES:
+        ALLEGIANCES.append(allegiance)
+    return ALLEGIANCES.index(allegiance)
+
+class Table:
+    """Growable struct-of-arrays storage. Each row is viewed by one Python object."""
+    FIELDS = {}
+
+    def __init__(self, capacity=8):
+        self.size = 0
+        self.objects = []  # row index -> Unit/Skill viewing that row
+        for field, dtype in self.FIELDS.items():
+            setattr(self, field, np.zeros(capacity, dtype=dtype))
+
+    def append(self, obj, **values):
+        # Add a row for obj and return its index
+        if self.size == self.capacity():
+            self.grow()
+        index = self.size
+        for field, value in values.items():
+            getattr(self, field)[index] = value
+        self.objects.append(obj)
+        self.size += 1
+        return index
+
+    def capacity(self):
+        return len(getattr(self, next(iter(self.FIELDS))))
+
+    def reserve(self, count):
+        # Make room for `count` more rows so they can be filled column by column
+        while self.capacity() < self.size + count:
+            self.grow()
+
+    def grow(self):
+        # Double the capacity of every column
+        for field in self.FIELDS:
+            column = getattr(self, field)
+            grown = np.zeros(max(1, len(column)) * 2, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, field, grown)
+
+    def row(self, index):
+        # Copy one row out as a dict of plain Python values
+        return {field: getattr(self, field)[index].item() for field in self.FIELDS}
+
+class UnitTable(Table):
+    FIELDS = {
+        "hp": np.int32, "max_hp": np.int32, "atk": np.int32,
+        "movement": np.int32, "attack_range": np.int32,
+        "allegiance": np.int8, "has_moved": np.bool_, "has_attacked": np.bool_,
+        "x": np.int32, "y": np.int32, "alive": np.bool_,
+    }
+
+class SkillTable(Table):
+    FIELDS = {"turns_until_ready": np.int32, "owner": np.int32}
+
+# Immutable per-type definitions shared by every Unit/Skill instance of that type.
+# Instances only carry their mutable state (hp, flags, cooldowns) in the tables.
+SkillTemplate = namedtuple("SkillTemplate", "name damage range effect_type cooldown description", defaults=("",))
+UnitTemplate = namedtuple("UnitTemplate", "unit_type max_hp atk movement attack_range skills vision", defaults=((), 10))
+
+_templates = {}
+
+def shared(template):
+    # Return the canonical instance of an equal template so identical stat blocks are stored once
+    return _templates.setdefault(template, template)
+
+def from_template(field):
+    # Read-only property backed by the shared template
+    def fget(self):
+        return getattr(self.template, field)
+    return property(fget)
+
+def column(field):
+    # Property that reads and writes this object's row in its table
+    def fget(self):
+        return getattr(self._table, field)[self._index].item()
+    def fset(self, value):
+        getattr(self._table, field)[self._index] = value
+    return property(fget, fset)
+
+class SkillList(list):
+    """A unit's skills. Skills added after placement are moved into the map's skill table."""
+    __slots__ = ("unit",)
+
+    def __init__(self, unit):
+        super().__init__()
+        self.unit = unit
+
+    def append(self, skill):
+        super().append(skill)
+        if self.unit.battle_map is not None:
+            self.unit.battle_map.bind_skill(skill, self.unit)
+
+    def extend(self, skills):
+        for skill in skills:
+            self.append(skill)
+
+class Unit:
+    __slots__ = ("template", "name", "battle_map", "skills", "_table", "_index")
+    unit_type = from_template("unit_type")
+    vision = from_template("vision") #no fog of war for now
+    hp = column("hp")
+    max_hp = column("max_hp")
+    atk = column("atk")
+    movement = column("movement")
+    attack_range = column("attack_range")
+    has_moved = column("has_moved")  # Track if unit has moved during the turn
+    has_attacked = column("has_attacked")  # Track if unit has attacked during the turn
+
+    def __init__(self, unit_type, max_hp, atk, movement, attack_range, name=None, skills=None, allegiance="player", has_moved=False, has_attacked=False):
+        self.setup(shared(UnitTemplate(unit_type, max_hp, atk, movement, attack_range)), name, allegiance)
+
+    @classmethod
+    def from_template(cls, template, name=None, allegiance="player"):
+        # Create a unit of a shared type, with one Skill instance per template skill
+        unit = cls.__new__(cls)
+        unit.setup(template, name, allegiance)
+        return unit
+
+    def setup(self, template, name, allegiance):
+        self.template = template
+        self.name = name if name else template.unit_type
+        self.battle_map = None
+        # A unit owns a one-row table until BattleMap.add_unit moves it into the map's table
+        self._table = UnitTable(1)
+        self._index = self._table.append(
+            self, hp=template.max_hp,  # Current HP starts at maximum HP
+            max_hp=template.max_hp, atk=template.atk, movement=template.movement,
+            attack_range=template.attack_range, allegiance=allegiance_code(allegiance),
+            has_moved=False, has_attacked=False, x=-1, y=-1, alive=True)
+        self.skills = SkillList(self)
+        self.skills.extend(Skill.from_template(skill) for skill in template.skills)
+
+    @classmethod
+    def view(cls, template, name, battle_map, index):
+        # Wrap a row that is already filled in battle_map's unit table (bulk placement)
+        unit = cls.__new__(cls)
+        unit.template = template
+        unit.name = name if name else template.unit_type
+        unit.battle_map = battle_map
+        unit._table = battle_map.unit_table
+        unit._index = index
+        unit.skills = SkillList(unit)
+        return unit
+
+    @property
+    def allegiance(self):
+        return ALLEGIANCES[self._table.allegiance[self._index]]
+
+    @allegiance.setter
+    def allegiance(self, value):
+        self._table.allegiance[self._index] = allegiance_code(value)
+    
+    def display_info(self):
+        """Displays the full information of the unit."""
+        info = (
+            f"Name: {self.name}\n"
+            f"Type: {self.unit_type}\n"
+            f"HP: {self.hp}/{self.max_hp}\n"  # Display current HP and max HP
+            f"Attack: {self.atk}\n"
+            f"Movement: {self.movement}\n"
+            f"Attack Range: {self.attack_range}\n"
+            f"Allegiance: {self.allegiance}"
+        )
+        if self.skills:
+            info += f"\nSkill:"
+            for skill in self.skills:
+                info += f"\n{skill.name}: {skill.description}"
+        print(info)
+
+    def attack(self, target):
+        # Attack logic
+        if target:
+            target.hp -= self.atk
+            logger.info("%s attacks %s for %s damage. %s has %s HP remaining.", self.name, target.name, self.atk, target.name, target.hp)
+
+    def check_unit_defeated(self):
+        return self.hp <= 0
+
+class Skill:
+    __slots__ = ("template", "_table", "_index")
+    name = from_template("name")
+    damage = from_template("damage")
+    range = from_template("range")
+    effect_type = from_template("effect_type")
+    cooldown = from_template("cooldown")
+    description = from_template("description")
+    turns_until_ready = column("turns_until_ready")
+
+    def __init__(self, name, damage, range, effect_type, cooldown, turns_until_ready = 0, description = ""):
+        self.setup(shared(SkillTemplate(name, damage, range, effect_type, cooldown, description)), turns_until_ready)
+
+    @classmethod
+    def from_template(cls, template, turns_until_ready=0):
+        skill = cls.__new__(cls)
+        skill.setup(template, turns_until_ready)
+        return skill
+
+    def setup(self, template, turns_until_ready):
+        self.template = template
+        self._table = SkillTable(1)
+        self._index = self._table.append(self, turns_until_ready=turns_until_ready, owner=-1)
+
+    @classmethod
+    def view(cls, template, table, index):
+        # Wrap a row that is already filled in a map's skill table (bulk placement)
+        skill = cls.__new__(cls)
+        skill.template = template
+        skill._table = table
+        skill._index = index
+        return skill
+
+    def is_available(self):
+        return self.turns_until_ready == 0
+
+    def apply_effect(self, user, target):
+        if self.effect_type == "damage":
+            target.hp -= self.damage
+        # Add other effect types like healing, buffs, etc.
+        elif self.effect_type == "healing":
+            target.hp += self.damage
+        self.turns_until_ready = self.cooldown
+
+class Passive_skill(Skill):
+    __slots__ = ()
+
+class ChangeSet:
+    """What one engine action changed, handed to views so they redraw only that.
+
+    BattleMap collects one per action (a move, an attack, a skill, placing
+    units, either half of end_turn) and passes it to the update callback and
+    to every observer's on_changes once the action is over.
+    """
+    __slots__ = ("cells", "added", "moved", "hp", "removed", "cooldowns", "turn_advanced")
+
+    def __init__(self):
+        self.cells = set() # (x, y) whose occupant, or its HP, changed
+        self.added = set() # units placed on the board
+        self.moved = {} # unit -> ((start_x, start_y), (end_x, end_y))
+        self.hp = set() # units whose HP changed
+        self.removed = set() # units taken off the board
+        self.cooldowns = set() # skill table rows whose cooldown changed
+        self.turn_advanced = False
+
+    def __bool__(self):
+        return bool(self.cells or self.cooldowns or self.turn_advanced)
+
+class BattleMap:
+    """Headless battle engine: grid, units and turn logic, with no Qt dependency."""
+
+    def __init__(self, n, m, turn=1, territory="plain", ai_policy=None):
+        self.rows = n
+        self.columns = m
+        # Board state lives in NumPy arrays: `grid` holds the Unit objects for
+        # compatibility, `unit_ids` the matching row in unit_table (-1 = empty).
+        self.grid = np.empty((n, m), dtype=object)
+        self.unit_ids = np.full((n, m), -1, dtype=np.int32)
+        self.unit_table = UnitTable()
+        self.skill_table = SkillTable()
+        self.passable = np.ones((n, m), dtype=np.bool_) # terrain a unit may walk through
+        # reachable_cells results, dropped whenever a unit is placed, moved or removed
+        self.reachable_memo = {}
+        from enemy_ai import Easy_EnemyAI # imported here because enemy_ai builds on this module
+        self.enemy_ai = (ai_policy or Easy_EnemyAI)(self) # e.g. enemy_ai.Hard_EnemyAI
+        self.turn = turn
+        self.territory = territory
+        self.winner = None
+        self.observers = []
+        # Spatial index: unit -> (x, y) and allegiance -> live units.
+        # The per-allegiance dicts are used as insertion-ordered sets so unit
+        # iteration order is deterministic.
+        self.positions = {}
+        self.armies = {}
+        # Undo journal, None unless a checkpoint is active (see checkpoint/rollback)
+        self.journal = None
+        # Zobrist hash of the position, kept up to date by every action
+        self.zobrist = 0
+        self.enemy_phase = False # True while end_turn runs the enemy's actions
+        self.metrics = None # a metrics.TurnMetrics while the game is instrumented
+        # Changes of the action in progress, None while they are not collected (lookahead)
+        self.changes = ChangeSet()
+        self.update_callback = None
+
+    def set_update_callback(self, callback):
+        # Set the callback for UI updates, called with a ChangeSet after every action
+        self.update_callback = callback
+
+    def flush_changes(self):
+        # Hand the changes of the action that just finished to the update callback and observers
+        changes = self.changes
+        if not changes:
+            return
+        self.changes = ChangeSet()
+        if self.update_callback is not None:
+            self.update_callback(changes)
+        self.notify("on_changes", changes)
+
+    def set_metrics(self, metrics):
+        # Attach a metrics.TurnMetrics to record timings and counters, or None to stop
+        self.metrics = metrics
+
+    def measure(self, phase):
+        # Context manager timing `phase` into the attached metrics, a shared no-op otherwise
+        return UNMEASURED if self.metrics is None else self.metrics.phase(phase)
+
+    def add_observer(self, observer):
+        # Register a BattleObserver to be notified of engine events
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def position_of(self, unit):
+        # Look up a unit's position in O(1)
+        return self.positions.get(unit, (None, None))
+
+    def units_of(self, allegiance):
+        # Live units of the given allegiance, in placement order
+        return list(self.armies.get(allegiance, ()))
+
+    def bind_unit(self, unit):
+        # Move a unit's stats (and its skills) into this map's tables
+        unit._index = self.unit_table.append(unit, **unit._table.row(unit._index))
+        unit._table = self.unit_table
+        unit.battle_map = self
+        for skill in unit.skills:
+            self.bind_skill(skill, unit)
+
+    def bind_skill(self, skill, unit):
+        values = skill._table.row(skill._index)
+        values["owner"] = unit._index
+        skill._index = self.skill_table.append(skill, **values)
+        skill._table = self.skill_table
+        self.zobrist ^= zobrist_key(HASH_COOLDOWN, skill._index, values["turns_until_ready"])
+
+    def positions_of_hostiles(self, allegiance):
+        # Positions of every live unit not on the given side
+        return [self.positions[unit] for side, army in self.armies.items() if side != allegiance for unit in army]
+
+    def place_unit(self, unit, x, y):
+        # Put a unit on the grid and register it in the spatial index
+        if unit.battle_map is not self:
+            self.bind_unit(unit)
+        self.grid[x, y] = unit
+        self.unit_ids[x, y] = unit._index
+        self.unit_table.x[unit._index] = x
+        self.unit_table.y[unit._index] = y
+        self.unit_table.alive[unit._index] = True
+        self.zobrist ^= self.unit_hash(unit._index)
+        self.reachable_memo.clear()
+        self.positions[unit] = (x, y)
+        self.armies.setdefault(unit.allegiance, {})[unit] = None
+
+    def relocate_unit(self, unit, start_x, start_y, end_x, end_y):
+        # Move a unit between cells, keeping the arrays and index in sync
+        self.grid[end_x, end_y] = unit  # Place the unit at the destination
+        self.grid[start_x, start_y] = None  # Clear the starting cell
+        self.unit_ids[end_x, end_y] = unit._index
+        self.unit_ids[start_x, start_y] = -1
+        self.unit_table.x[unit._index] = end_x
+        self.unit_table.y[unit._index] = end_y
+        self.zobrist ^= (zobrist_key(HASH_CELL, unit._index, start_x * self.columns + start_y)
+                         ^ zobrist_key(HASH_CELL, unit._index, end_x * self.columns + end_y))
+        self.reachable_memo.clear()
+        self.positions[unit] = (end_x, end_y)
+
+    def vacate_unit(self, unit, x, y):
+        # Take a unit off the grid and out of the spatial index
+        self.zobrist ^= self.unit_hash(unit._index)
+        self.grid[x, y] = None
+        self.unit_ids[x, y] = -1
+        self.unit_table.alive[unit._index] = False
+        self.reachable_memo.clear()
+        self.positions.pop(unit, None)
+        self.armies.get(unit.allegiance, {}).pop(unit, None)
+
+    def state_hash(self, index):
+        # Hash of one unit's HP bucket and action flags
+        table = self.unit_table
+        return (zobrist_key(HASH_HP, index, max(int(table.hp[index]), 0) // HP_BUCKET)
+                ^ zobrist_key(HASH_MOVED, index, int(table.has_moved[index]))
+                ^ zobrist_key(HASH_ATTACKED, index, int(table.has_attacked[index])))
+
+    def unit_hash(self, index):
+        # Hash of everything about one placed unit
+        table = self.unit_table
+        return zobrist_key(HASH_CELL, index, int(table.x[index]) * self.columns + int(table.y[index])) ^ self.state_hash(index)
+
+    def compute_zobrist(self):
+        """Hash the whole position from scratch; self.zobrist always equals this."""
+        units, skills = self.unit_table, self.skill_table
+        live = np.flatnonzero(units.alive[:units.size])
+        code = zobrist_xor(HASH_CELL, live, units.x[live].astype(np.int64) * self.columns + units.y[live])
+        code ^= zobrist_xor(HASH_HP, live, np.maximum(units.hp[live], 0) // HP_BUCKET)
+        code ^= zobrist_xor(HASH_MOVED, live, units.has_moved[live])
+        code ^= zobrist_xor(HASH_ATTACKED, live, units.has_attacked[live])
+        code ^= zobrist_xor(HASH_COOLDOWN, np.arange(skills.size), skills.turns_until_ready[:skills.size])
+        if self.enemy_phase:
+            code ^= zobrist_key(HASH_SIDE, 0, 0)
+        return code
+
+    def checkpoint(self):
+        """Start recording changes and return a marker that rollback() can return to.
+
+        While a checkpoint is active every action records the previous value of
+        each cell, HP, flag and cooldown it changes, so undoing a branch costs
+        as much as playing it rather than copying the map.
+        """
+        if self.journal is None:
+            self.journal = []
+        return len(self.journal)
+
+    def rollback(self, marker=0):
+        """Undo every change recorded since checkpoint() returned `marker`.
+
+        Observers are not notified of undone changes. Recording continues
+        until stop_journal() is called.
+        """
+        journal = self.journal
+        while len(journal) > marker:
+            undo, *args = journal.pop()
+            undo(*args)
+
+    def stop_journal(self):
+        # Stop recording and forget the journal, keeping the current state
+        self.journal = None
+
+    @contextmanager
+    def lookahead(self):
+        # Try actions and undo them on exit, with observers, metrics and this thread's logging muted meanwhile
+        started = self.journal is None
+        marker = self.checkpoint()
+        observers, self.observers = self.observers, []
+        metrics, self.metrics = self.metrics, None
+        changes, self.changes = self.changes, None
+        try:
+            with muted():
+                yield self
+        finally:
+            self.rollback(marker)
+            if started:
+                self.stop_journal()
+            self.observers = observers
+            self.metrics = metrics
+            self.changes = changes
+
+    def remember(self, table, field, index):
+        # Journal the current value of one table cell before it is overwritten
+        if self.journal is not None:
+            self.journal.append((self.set_column, table, field, index, getattr(table, field)[index]))
+
+    def remember_many(self, table, field, indices):
+        if self.journal is not None and len(indices):
+            self.journal.append((self.set_column, table, field, indices, getattr(table, field)[indices]))
+
+    def remember_attribute(self, name):
+        if self.journal is not None:
+            self.journal.append((setattr, self, name, getattr(self, name)))
+
+    def set_column(self, table, field, index, value):
+        # Looked up by name because Table.grow() may have replaced the column array
+        getattr(table, field)[index] = value
+
+    def restore_unit(self, unit, x, y, army):
+        # Undo vacate_unit, putting the unit back at its original place in its army's order
+        self.place_unit(unit, x, y)
+        current = self.armies[unit.allegiance]
+        current.clear()
+        current.update(army)
+
+    def cells_in_range(self, x, y, range_value, kind="area", skill=None):
+        """Return the cells within range of (x, y) that are valid for `kind`.
+
+        kind is "area" (every cell on the map), "move" (cells the unit at (x, y)
+        can move to), "attack" (cells holding a hostile unit) or "skill" (cells
+        `skill` may target). Cost depends on the range, not on the map size.
+        """
+        dx, dy = range_offsets(range_value)
+        xs, ys = dx + x, dy + y
+        inside = (xs >= 0) & (xs < self.rows) & (ys >= 0) & (ys < self.columns)
+        xs, ys = xs[inside], ys[inside]
+        if self.metrics is not None:
+            self.metrics.count("cells_scanned", len(xs))
+        if kind != "area":
+            ids = self.unit_ids[xs, ys]
+            own = self.unit_table.allegiance[self.unit_ids[x, y]]
+            hostile = (ids >= 0) & (self.unit_table.allegiance[ids] != own)
+            if kind == "move":
+                keep = ids < 0
+            elif kind == "attack":
+                keep = hostile
+            elif skill is not None and skill.effect_type in FRIENDLY_EFFECTS:
+                keep = (ids >= 0) & ~hostile
+            elif skill is not None:
+                keep = hostile
+            else:
+                keep = ids >= 0
+            xs, ys = xs[keep], ys[keep]
+        cells = list(zip(xs.tolist(), ys.tolist()))
+        if kind == "move":
+            unit = self.grid[x, y]
+            reachable = self.reachable_cells(x, y, unit.movement, unit.allegiance)
+            cells = [cell for cell in cells if cell in reachable]
+        return cells
+
+    def reachable_cells(self, start_x, start_y, movement, allegiance):
+        """Map each empty cell a unit can walk to in at most `movement` steps to its step count.
+
+        Bounded BFS over the 4-neighbour grid: impassable terrain and hostile
+        units block, allied units can be walked through but not stopped on.
+        Cells come nearest first. The result is memoized until the board changes,
+        so checking one candidate move is a dict lookup.
+        """
+        key = (start_x, start_y, movement, allegiance)
+        cells = self.reachable_memo.get(key)
+        if cells is not None:
+            return cells
+        unit_ids = self.unit_ids
+        allegiances = self.unit_table.allegiance
+        passable = self.passable
+        own = allegiance_code(allegiance)
+        frontier = [(start_x, start_y)]
+        visited = {(start_x, start_y)}
+        cells = {}
+        for steps in range(1, movement + 1):
+            next_frontier = []
+            for x, y in frontier:
+                for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                    if (nx, ny) in visited or not (0 <= nx < self.rows and 0 <= ny < self.columns):
+                        continue
+                    visited.add((nx, ny))
+                    if not passable[nx, ny]:
+                        continue
+                    unit_id = unit_ids[nx, ny]
+                    if unit_id >= 0 and allegiances[unit_id] != own:
+                        continue # hostile units block the way
+                    next_frontier.append((nx, ny))
+                    if unit_id < 0:
+                        cells[(nx, ny)] = steps
+            frontier = next_frontier
+        if self.metrics is not None:
+            self.metrics.count("bfs_nodes", len(visited))
+        self.reachable_memo[key] = cells
+        return cells
+
+    def notify(self, event, *args):
+        # Call the hook named `event` on every observer
+        for observer in self.observers:
+            getattr(observer, event)(self, *args)
+
+    def display_map(self):
+        for row in self.grid:
+            row_display = " | ".join(["." if cell is None else ("player" if cell.allegiance == "player" else "enemy") for cell in row])
+            print(row_display)
+            print("-" * (4 * self.columns - 1))
+
+    def add_unit(self, unit, x, y):
+        if 0 <= x < self.rows and 0 <= y < self.columns:
+            if self.unit_ids[x, y] < 0:
+                self.remember_attribute("zobrist")
+                self.place_unit(unit, x, y)
+                if self.journal is not None:
+                    self.journal.append((self.vacate_unit, unit, x, y))
+                logger.info("Unit '%s' placed at (%s, %s).", unit.name, x, y)
+                if self.changes is not None:
+                    self.changes.cells.add((x, y))
+                    self.changes.added.add(unit)
+                self.notify("on_unit_added", unit, x, y)
+                self.flush_changes()
+            else:
+                logger.warning("Cell is already occupied!")
+        else:
+            logger.warning("Invalid coordinates!")
+
+    
+    def bulk_add_units(self, templates, names, columns, skills=None):
+        """Place many units at once by filling the unit table column by column.
+
+        templates and names hold one entry per unit, columns maps UnitTable field
+        names (at least x and y) to arrays; missing stats come from the templates.
+        skills is an optional (owners, templates, turns_until_ready) triple with
+        owners indexing the new units; by default every unit gets its template's
+        skills, ready to use. Cells must be free; no per-unit logging is done.
+        """
+        count = len(templates)
+        table = self.unit_table
+        table.reserve(count)
+        start, end = table.size, table.size + count
+        for field in ("max_hp", "atk", "movement", "attack_range"):
+            getattr(table, field)[start:end] = [getattr(template, field) for template in templates]
+        table.hp[start:end] = table.max_hp[start:end]  # Current HP starts at maximum HP
+        table.has_moved[start:end] = False
+        table.has_attacked[start:end] = False
+        table.alive[start:end] = True
+        for field, values in columns.items():
+            getattr(table, field)[start:end] = values
+        units = [Unit.view(template, name, self, index)
+                 for index, template, name in zip(range(start, end), templates, names)]
+        table.objects.extend(units)
+        table.size = end
+
+        xs, ys = table.x[start:end], table.y[start:end]
+        self.unit_ids[xs, ys] = np.arange(start, end, dtype=np.int32)
+        for unit, x, y in zip(units, xs.tolist(), ys.tolist()):
+            self.grid[x, y] = unit
+            self.positions[unit] = (x, y)
+            self.armies.setdefault(unit.allegiance, {})[unit] = None
+        self.reachable_memo.clear()
+
+        if skills is None:
+            owners = [offset for offset, template in enumerate(templates) for _ in template.skills]
+            skill_templates = [skill for template in templates for skill in template.skills]
+            cooldowns = 0
+        else:
+            owners, skill_templates, cooldowns = skills
+        skill_table = self.skill_table
+        skill_table.reserve(len(skill_templates))
+        first = skill_table.size
+        skill_table.owner[first:first + len(skill_templates)] = np.asarray(owners, dtype=np.int32) + start
+        skill_table.turns_until_ready[first:first + len(skill_templates)] = cooldowns
+        for index, owner, template in zip(range(first, first + len(skill_templates)), owners, skill_templates):
+            skill = Skill.view(template, skill_table, index)
+            skill_table.objects.append(skill)
+            list.append(units[owner].skills, skill) # already bound, skip SkillList.append
+        skill_table.size = first + len(skill_templates)
+
+        self.remember_attribute("zobrist") # bulk placement itself is not journaled
+        new = np.arange(start, end)
+        self.zobrist ^= zobrist_xor(HASH_CELL, new, xs.astype(np.int64) * self.columns + ys)
+        self.zobrist ^= zobrist_xor(HASH_HP, new, np.maximum(table.hp[start:end], 0) // HP_BUCKET)
+        self.zobrist ^= zobrist_xor(HASH_MOVED, new, table.has_moved[start:end])
+        self.zobrist ^= zobrist_xor(HASH_ATTACKED, new, table.has_attacked[start:end])
+        self.zobrist ^= zobrist_xor(HASH_COOLDOWN, np.arange(first, skill_table.size), skill_table.turns_until_ready[first:skill_table.size])
+
+        if self.changes is not None:
+            self.changes.cells.update(zip(xs.tolist(), ys.tolist()))
+            self.changes.added.update(units)
+        if self.observers:
+            for unit in units:
+                self.notify("on_unit_added", unit, *self.positions[unit])
+        self.flush_changes()
+        return units
+
+    def is_within_bounds(self, unit, start_x, start_y, end_x, end_y):
+        # Check if the move is within the unit’s movement range
+        if unit.has_moved:
+            logger.warning("%s has already moved this turn!", unit.name)
+            return
+        if distance(start_x, start_y, end_x, end_y) > unit.movement:
+            return False
+
+        # The target must be an empty cell with a walkable path no longer than the unit's movement
+        return (end_x, end_y) in self.reachable_cells(start_x, start_y, unit.movement, unit.allegiance)
+    
+    def move_unit(self, unit, start_x, start_y, end_x, end_y):
+        # Move the specified unit from its current position to the target coordinates if valid
+        logger.debug("Attempting to move %s from (%s, %s) to (%s, %s)", unit.name, start_x, start_y, end_x, end_y)
+        if not unit:
+            logger.warning("No unit selected!")
+            return
+
+        if not self.is_within_bounds(unit, start_x, start_y, end_x, end_y):
+            logger.warning("Cannot move there!")
+            return
+
+        # Move the unit if all checks pass
+        logger.debug("Moving %s from (%s, %s) to (%s, %s) on the grid.", unit.name, start_x, start_y, end_x, end_y)
+        self.remember_attribute("zobrist")
+        self.relocate_unit(unit, start_x, start_y, end_x, end_y)
+        if self.journal is not None:
+            self.journal.append((self.relocate_unit, unit, end_x, end_y, start_x, start_y))
+        self.remember(unit._table, "has_moved", unit._index)
+        self.zobrist ^= zobrist_key(HASH_MOVED, unit._index, unit.has_moved) ^ zobrist_key(HASH_MOVED, unit._index, 1)
+        unit.has_moved = True  # Set the has_moved flag to True
+        logger.info("Unit '%s' successfully moved to (%s, %s).", unit.name, end_x, end_y)
+        if self.metrics is not None:
+            self.metrics.count("actions")
+        if self.changes is not None:
+            self.changes.cells.update(((start_x, start_y), (end_x, end_y)))
+            self.changes.moved[unit] = ((start_x, start_y), (end_x, end_y))
+        self.notify("on_unit_moved", unit, start_x, start_y, end_x, end_y)
+        self.flush_changes()
+
+    def able_to_attack(self, unit, start_x, start_y, target_x, target_y):
+        # Check if there's an enemy unit at the target location
+        if not unit:
+            logger.warning("No unit selected!")
+            return False
+
+        if unit.has_attacked:
+            logger.warning("%s has already attacked this turn!", unit.name)
+            return False
+        target_id = self.unit_ids[target_x, target_y]
+        if target_id >= 0 and self.unit_table.allegiance[target_id] != unit._table.allegiance[unit._index]:
+            # Check if the target is within attack range
+            if distance(start_x, start_y, target_x, target_y) <= unit.attack_range:
+                return True
+            else:
+                logger.warning("Target is out of attack range!")
+                return False
+        else:
+            logger.warning("No enemy at the target location!")
+            return False
+
+    def attack_unit(self, unit, start_x, start_y, target_x, target_y):
+        # Attack a target with the specified unit, if within range
+        if self.able_to_attack(unit, start_x, start_y, target_x, target_y):
+            target = self.grid[target_x, target_y]
+            self.remember_attribute("zobrist")
+            self.remember(target._table, "hp", target._index)
+            self.remember(unit._table, "has_attacked", unit._index)
+            self.remember(unit._table, "has_moved", unit._index)
+            self.zobrist ^= self.state_hash(unit._index) ^ self.state_hash(target._index)
+            unit.attack(target)
+            unit.has_attacked = True  # Set the has_attacked flag to True
+            unit.has_moved = True # You cannot move after attacked.
+            self.zobrist ^= self.state_hash(unit._index) ^ self.state_hash(target._index)
+            if self.metrics is not None:
+                self.metrics.count("actions")
+            if self.changes is not None:
+                self.changes.cells.add((target_x, target_y))
+                self.changes.hp.add(target)
+            self.notify("on_unit_attacked", unit, target, unit.atk)
+            # function to check if unit is defeated  
+            logger.debug("%s defeated: %s", target.name, target.hp <= 0)       
+            if target.check_unit_defeated():
+                self.remove_defeated_unit(target, target_x, target_y)
+            self.flush_changes()
+
+    def wait_unit(self, unit):
+        # End a unit's actions for this turn without doing anything
+        x, y = self.position_of(unit)
+        if x is None:
+            logger.warning("No unit selected!")
+            return
+        self.remember_attribute("zobrist")
+        self.remember(unit._table, "has_moved", unit._index)
+        self.remember(unit._table, "has_attacked", unit._index)
+        self.zobrist ^= self.state_hash(unit._index)
+        unit.has_moved = True
+        unit.has_attacked = True
+        self.zobrist ^= self.state_hash(unit._index)
+        logger.info("%s waits this turn.", unit.name)
+        if self.metrics is not None:
+            self.metrics.count("actions")
+        self.notify("on_unit_waited", unit, x, y)
+
+    def remove_defeated_unit(self, target, target_x, target_y):
+        # Remove the target from the grid and check whether its army is wiped out
+        if self.journal is not None:
+            self.journal.append((self.restore_unit, target, target_x, target_y, dict(self.armies[target.allegiance])))
+        self.vacate_unit(target, target_x, target_y)
+        if self.changes is not None:
+            self.changes.cells.add((target_x, target_y))
+            self.changes.removed.add(target)
+        logger.info("%s defeated!", target.name)
+        self.notify("on_unit_defeated", target, target_x, target_y)
+        if self.check_army_defeated(target.allegiance):
+            self.handle_gameover(target.allegiance)
+
+    
+    def use_skill(self, unit, skill, start_x, start_y, target_x, target_y):
+        # Deploy a skill on a target.
+        target = self.grid[target_x, target_y]
+        if not target:
+            logger.warning("No unit at the target location!")
+            return False           
+
+        if (target.allegiance != unit.allegiance and skill.effect_type in FRIENDLY_EFFECTS) \
+        or (target.allegiance == unit.allegiance and (skill.effect_type == "debuff" or skill.effect_type == "attack")):
+            logger.warning("Not a valid Target!")
+            return False                      
+
+        if skill.turns_until_ready > 0:
+            logger.warning("Skill %s is on cooldown for %s turns.", skill.name, skill.turns_until_ready)
+            return False
+
+        # limit healing if units' hp is full
+        if skill.effect_type == "heal" and target.hp >= target.max_hp:
+            logger.warning("%s's HP is already full.", target.name)
+            return False           
+
+        if distance(start_x, start_y, target_x, target_y) > skill.range:
+            logger.warning("Target is out of range for skill %s.", skill.name)
+            return False
+
+        self.remember_attribute("zobrist")
+        self.remember(target._table, "hp", target._index)
+        self.remember(skill._table, "turns_until_ready", skill._index)
+        self.remember(unit._table, "has_moved", unit._index)
+        self.remember(unit._table, "has_attacked", unit._index)
+        changed = {unit._index, target._index} # the same unit when it heals itself
+        for index in changed:
+            self.zobrist ^= self.state_hash(index)
+        self.zobrist ^= zobrist_key(HASH_COOLDOWN, skill._index, skill.turns_until_ready)
+
+        # Apply the skill effect
+        amount = None
+        if skill.effect_type == "attack":
+            damage = amount = skill.damage
+            target.hp -= damage
+            logger.info("%s used %s on %s, dealing %s damage.", unit.name, skill.name, target.name, damage)
+        elif skill.effect_type == "heal": 
+            heal_amount = amount = skill.damage
+            target.hp = min(target.max_hp , target.hp + heal_amount)
+            logger.info("%s used %s on %s, heals %s HP.", unit.name, skill.name, target.name, heal_amount)
+
+        # Set the cooldown
+        skill.turns_until_ready = skill.cooldown  # Assuming skills have a default cooldown value
+        # Set unit complete its term
+        unit.has_moved = True
+        unit.has_attacked = True
+        for index in changed:
+            self.zobrist ^= self.state_hash(index)
+        self.zobrist ^= zobrist_key(HASH_COOLDOWN, skill._index, skill.turns_until_ready)
+        if self.metrics is not None:
+            self.metrics.count("actions")
+        if self.changes is not None:
+            self.changes.cells.add((target_x, target_y))
+            self.changes.hp.add(target)
+            self.changes.cooldowns.add(skill._index)
+        if amount is not None: # observers see the finished action, cooldown included
+            self.notify("on_skill_used", unit, skill, target, amount)
+
+        if target.check_unit_defeated():
+            self.remove_defeated_unit(target, target_x, target_y)
+        self.flush_changes()
+        return True
+
+    def end_turn(self):
+        # End the player's turn, reset my units, and initiate enemy actions
+        self.start_enemy_turn()
+        # Enemy performs actions
+        with self.measure("enemy_ai"):
+            self.enemy_ai.execute_enemy_turn()
+        self.finish_enemy_turn()
+
+    def start_enemy_turn(self):
+        # First half of end_turn, split out so a UI can play the enemy's actions itself
+        logger.info("Ending turn. Resetting units and initiating enemy actions.")
+        # Reset my units' movement and attack status
+        with self.measure("player_reset"):
+            self.reset_units_actions("player") # reset player's actions first for some skill to limit enemy action in next turn.
+        self.toggle_phase()
+        self.notify("on_enemy_turn_started")
+        self.flush_changes()
+
+    def finish_enemy_turn(self):
+        self.toggle_phase()
+        # after enemy turn, check victory status
+        self.check_army_defeated("player")
+        logger.info("Enemy's turn completed.")
+
+        # Reset enemy units for the next turn
+        with self.measure("enemy_reset"):
+            self.reset_units_actions("enemy")
+        self.remember_attribute("turn")
+        self.turn += 1
+
+        with self.measure("cooldown_tick"):
+            self.skill_cooldown() #decrement all units' skill's cooldown by 1
+        if self.metrics is not None:
+            self.metrics.finish_turn(self.turn - 1)
+        if self.changes is not None:
+            self.changes.turn_advanced = True
+
+        logger.info("Turn %s: Player's turn start.", self.turn)
+        self.notify("on_turn_ended", self.turn)
+        self.flush_changes()
+
+    def toggle_phase(self):
+        # Switch between the player's and the enemy's half of the turn
+        self.remember_attribute("zobrist")
+        self.remember_attribute("enemy_phase")
+        self.enemy_phase = not self.enemy_phase
+        self.zobrist ^= zobrist_key(HASH_SIDE, 0, 0)
+
+    def skill_cooldown(self):
+        """Decreases the cooldown of all skills for every unit on the map."""
+        table = self.skill_table
+        cooldowns = table.turns_until_ready[:table.size]
+        ticking = self.unit_table.alive[table.owner[:table.size]] & (cooldowns > 0)
+        indices = np.flatnonzero(ticking)
+        self.remember_attribute("zobrist")
+        self.remember_many(table, "turns_until_ready", indices)
+        self.zobrist ^= zobrist_xor(HASH_COOLDOWN, indices, cooldowns[indices])
+        cooldowns[ticking] -= 1
+        self.zobrist ^= zobrist_xor(HASH_COOLDOWN, indices, cooldowns[indices])
+        if self.changes is not None:
+            self.changes.cooldowns.update(indices.tolist())
+        if logger.isEnabledFor(logging.DEBUG):
+            for index in np.flatnonzero(ticking):
+                skill = table.objects[index]
+                unit = self.unit_table.objects[table.owner[index]]
+                logger.debug("Skill '%s' on unit '%s' cooldown decreased to %s.", skill.name, unit.name, skill.turns_until_ready)
+
+
+    def reset_units_actions(self, allegiance):
+        # Reset has_moved and has_attacked flags for all units of the specified allegiance.
+        table = self.unit_table
+        mask = table.alive[:table.size] & (table.allegiance[:table.size] == allegiance_code(allegiance))
+        moved = np.flatnonzero(mask & table.has_moved[:table.size])
+        attacked = np.flatnonzero(mask & table.has_attacked[:table.size])
+        self.remember_attribute("zobrist")
+        self.remember_many(table, "has_moved", moved)
+        self.remember_many(table, "has_attacked", attacked)
+        for kind, indices in ((HASH_MOVED, moved), (HASH_ATTACKED, attacked)):
+            self.zobrist ^= zobrist_xor(kind, indices, 1) ^ zobrist_xor(kind, indices, 0)
+        table.has_moved[:table.size][mask] = False
+        table.has_attacked[:table.size][mask] = False
+
+    def check_army_defeated(self, allegiance):
+        # Check if all units of the specified allegiance ('my' or 'enemy') are defeated.
+        return not self.armies.get(allegiance)
+    
+    def handle_gameover(self, allegiance):
+        logger.info("%s lost all units!", allegiance)
+        self.remember_attribute("winner")
+        self.winner = "enemy" if allegiance == "player" else "player"
+        self.notify("on_game_over", allegiance)
+ 
+    
+    def display_units(self):
+        """Display all my units and their positions on the map."""
+        for unit in self.armies.get("player", ()):
+            x, y = self.positions[unit]
+            print(f"{unit.name} at ({x}, {y}) - HP: {unit.hp}")
@@ -0,0 +1,97 @@
+import json
+import logging
+import sys
+import threading
+from contextlib import contextmanager
+from observer import BattleObserver
+
+_local = threading.local() # per thread: how many muted() blocks are active
+
+class ThreadMutedLogger(logging.Logger):
+    """A Logger that is also disabled inside muted() blocks of the current thread.
+
+    Checked where Logger checks `disabled`, so a muted call still costs only
+    an attribute lookup and builds no record.
+    """
+
+    @property
+    def disabled(self):
+        return self._disabled or getattr(_local, "muted", 0) > 0
+
+    @disabled.setter
+    def disabled(self, value):
+        self._disabled = value
+
+# Engine and AI messages go through this logger instead of print(). Messages use
+# lazy %-style arguments, so nothing is formatted unless the level is enabled.
+_default_class = logging.getLoggerClass()
+logging.setLoggerClass(ThreadMutedLogger)
+logger = logging.getLogger("slggame")
+logging.setLoggerClass(_default_class)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter("%(message)s"))
+logger.addHandler(_handler)
+
+def set_level(level):
+    """Set the engine log level, e.g. logging.DEBUG or "WARNING"."""
+    logger.disabled = False
+    logger.setLevel(level)
+
+def set_quiet(quiet=True):
+    """Silence all engine output. Disabled loggers return before building any record."""
+    logger.disabled = quiet
+
+@contextmanager
+def muted():
+    """Silence engine output from the current thread only, e.g. while the AI tries moves."""
+    _local.muted = getattr(_local, "muted", 0) + 1
+    try:
+        yield
+    finally:
+        _local.muted -= 1
+
+class JsonLinesSink(BattleObserver):
+    """BattleObserver that writes every engine event as one JSON object per line.
+
+    Attach with battle_map.add_observer(JsonLinesSink(open("trace.jsonl", "w"))).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, battle_map, event, **fields):
+        fields["event"] = event
+        fields["turn"] = battle_map.turn
+        self.stream.write(json.dumps(fields, default=int) + "\n")  # default=int handles NumPy scalars
+
+    def on_unit_added(self, battle_map, unit, x, y):
+        self.write(battle_map, "unit_added", unit=unit.name, allegiance=unit.allegiance, at=[x, y])
+
+    def on_unit_moved(self, battle_map, unit, start_x, start_y, end_x, end_y):
+        self.write(battle_map, "unit_moved", unit=unit.name, start=[start_x, start_y], end=[end_x, end_y])
+
+    def on_unit_attacked(self, battle_map, unit, target, damage):
+        self.write(battle_map, "unit_attacked", unit=unit.name, target=target.name, damage=damage, target_hp=target.hp)
+
+    def on_skill_used(self, battle_map, unit, skill, target, amount):
+        self.write(battle_map, "skill_used", unit=unit.name, skill=skill.name, target=target.name, amount=amount, target_hp=target.hp)
+
+    def on_unit_waited(self, battle_map, unit, x, y):
+        self.write(battle_map, "unit_waited", unit=unit.name, at=[x, y])
+
+    def on_unit_defeated(self, battle_map, unit, x, y):
+        self.write(battle_map, "unit_defeated", unit=unit.name, allegiance=unit.allegiance, at=[x, y])
+
+    def on_enemy_turn_started(self, battle_map):
+        self.write(battle_map, "enemy_turn_started")
+
+    def on_turn_ended(self, battle_map, turn):
+        self.write(battle_map, "turn_ended")
+
+    def on_game_over(self, battle_map, allegiance):
+        self.write(battle_map, "game_over", defeated=allegiance, winner=battle_map.winner)
+
+    def on_changes(self, battle_map, changes):
+        self.write(battle_map, "changes", cells=sorted(changes.cells), turn_advanced=changes.turn_advanced)
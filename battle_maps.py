@@ -1,12 +1,15 @@
-from myslg import BattleMap, Unit  # Adjust imports to match your project structure
+from functools import partial
+import numpy as np
+from battle_engine import BattleMap, Unit, allegiance_code  # Adjust imports to match your project structure
 from skills import *
+from units import *
 
 def basic_map():
     """Initialize a 5x5 map with a basic player and enemy unit setup."""
     battle_map = BattleMap(5, 5)
     battle_map.territory = "plain"
-    player_unit = Unit("Knight", 100, 20, 2, 1, "Knight", allegiance="player")
-    enemy_unit = Unit("Goblin", 50, 10, 2, 1, "Goblin", allegiance="enemy")
+    player_unit = Unit.from_template(KNIGHT, "Knight", allegiance="player")
+    enemy_unit = Unit.from_template(GOBLIN, "Goblin", allegiance="enemy")
     battle_map.add_unit(player_unit, 0, 0)
     battle_map.add_unit(enemy_unit, 2, 2)
     return battle_map
@@ -15,10 +18,10 @@ def forest_map():
     """Initialize a 6x6 map with a more complex setup."""
     battle_map = BattleMap(6, 6)
     battle_map.territory = "forest"
-    player_unit_1 = Unit("Archer", 80, 15, 3, 2, "Archer", allegiance="player")
-    player_unit_2 = Unit("Swordsman", 100, 20, 2, 1, "Swordsman", allegiance="player")
-    enemy_unit_1 = Unit("Orc", 120, 25, 2, 1, "Orc", allegiance="enemy")
-    enemy_unit_2 = Unit("Goblin", 50, 10, 2, 1, "Goblin", allegiance="enemy")
+    player_unit_1 = Unit.from_template(ARCHER, "Archer", allegiance="player")
+    player_unit_2 = Unit.from_template(SWORDSMAN, "Swordsman", allegiance="player")
+    enemy_unit_1 = Unit.from_template(ORC, "Orc", allegiance="enemy")
+    enemy_unit_2 = Unit.from_template(GOBLIN, "Goblin", allegiance="enemy")
     battle_map.add_unit(player_unit_1, 1, 1)
     battle_map.add_unit(player_unit_2, 2, 1)    
     battle_map.add_unit(enemy_unit_1, 4, 4)
@@ -29,13 +32,60 @@ def desert_map():
     """Initialize an 8x8 map with several player and enemy units."""
     battle_map = BattleMap(8, 8)
     battle_map.territory = "desert"
-    player_unit_1 = Unit("Cavalry", 120, 30, 4, 1, "Cavalry", allegiance="player")
-    player_unit_2 = Unit("Healer", 60, 20, 2, 3, "Healer", allegiance="player")
-    player_unit_2.skills.extend([fireball(),heal()])
-    enemy_unit_1 = Unit("Sand Raider", 70, 15, 3, 1, "Raider", allegiance="enemy")
-    enemy_unit_2 = Unit("Sand Raider", 70, 15, 3, 1, "Raider", allegiance="enemy")
+    player_unit_1 = Unit.from_template(CAVALRY, "Cavalry", allegiance="player")
+    player_unit_2 = Unit.from_template(HEALER, "Healer", allegiance="player")
+    enemy_unit_1 = Unit.from_template(SAND_RAIDER, "Raider", allegiance="enemy")
+    enemy_unit_2 = Unit.from_template(SAND_RAIDER, "Raider", allegiance="enemy")
     battle_map.add_unit(player_unit_1, 0, 7)
     battle_map.add_unit(player_unit_2, 7, 0)
     battle_map.add_unit(enemy_unit_1, 3, 4)
     battle_map.add_unit(enemy_unit_2, 5, 5)
-    return battle_map
\ No newline at end of file
+    return battle_map
+
+# Unit types both sides draw from on generated maps
+GENERATED_ARMY = (KNIGHT, SWORDSMAN, ARCHER, CAVALRY, HEALER)
+
+def generate_map(rows, columns, seed=0, units_per_side=None, obstacle_density=0.1, territory="plain", templates=GENERATED_ARMY):
+    """Build a reproducible random battle of any size (tested up to 1000x1000).
+
+    Obstacles are blobs of impassable terrain from thresholded value noise.
+    Terrain and armies are point-symmetric, so both sides get the same units
+    on mirrored cells: the player deploys in the leftmost columns, the enemy
+    in the rightmost. The same seed always gives the same map. Units are placed
+    with BattleMap.bulk_add_units, without per-unit logging.
+    """
+    rng = np.random.default_rng(seed)
+    battle_map = BattleMap(rows, columns, territory=territory)
+
+    # Coarse noise repeated up to the map size gives blobs; fine noise roughens their edges
+    block = max(2, min(rows, columns) // 16)
+    coarse = rng.random((rows // block + 1, columns // block + 1))
+    noise = np.repeat(np.repeat(coarse, block, axis=0), block, axis=1)[:rows, :columns] + 0.3 * rng.random((rows, columns))
+    noise = noise + noise[::-1, ::-1]
+    if obstacle_density > 0:
+        battle_map.passable[:] = noise < np.quantile(noise, 1 - obstacle_density)
+
+    # Deployment zone: free cells in the leftmost columns, mirrored for the enemy
+    if units_per_side is None:
+        units_per_side = max(1, rows * columns // 200)
+    depth = max(1, columns // 6)
+    zone = np.flatnonzero(battle_map.passable[:, :depth].ravel())
+    units_per_side = min(units_per_side, len(zone))
+    cells = rng.choice(zone, units_per_side, replace=False)
+    xs, ys = cells // depth, cells % depth
+    army = [templates[index] for index in rng.integers(len(templates), size=units_per_side)]
+
+    battle_map.bulk_add_units(
+        army + army, [None] * (2 * units_per_side),
+        {"x": np.concatenate([xs, rows - 1 - xs]), "y": np.concatenate([ys, columns - 1 - ys]),
+         "allegiance": [allegiance_code("player")] * units_per_side + [allegiance_code("enemy")] * units_per_side})
+    return battle_map
+
+# Map factories selectable by name, with the titles the map selection dialog shows
+MAPS = {"basic_map": basic_map, "forest_map": forest_map, "desert_map": desert_map,
+        "generated_32": partial(generate_map, 32, 32, seed=1),
+        "generated_200": partial(generate_map, 200, 200, seed=2, territory="forest"),
+        "generated_1000": partial(generate_map, 1000, 1000, seed=3)}
+MAP_TITLES = {"basic_map": "Basic Map", "forest_map": "Forest Map", "desert_map": "Desert Map",
+              "generated_32": "Generated 32x32", "generated_200": "Generated 200x200",
+              "generated_1000": "Generated 1000x1000"}
@@ -0,0 +1,73 @@
+"""Shared fixtures for the benchmark suite.
+
+Run from the repository root:
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:25%
+
+Boards are built once per parameter set. Benchmarks that change the board
+use benchmark.pedantic with a setup that copies it, so every round starts
+from the same position and the copy is not timed.
+"""
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # before anything imports Qt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from battle_engine import allegiance_code
+from battle_log import set_quiet
+from battle_maps import generate_map
+from units import GOBLIN, HEALER
+
+set_quiet()
+
+SIZES = (8, 32, 128, 512)
+UNITS = (4, 32, 256) # per side
+
+def board_params():
+    # (size, units per side) pairs whose armies fit in the deployment zones
+    return [pytest.param(size, units, id=f"{size}x{size}-{units}u")
+            for size in SIZES for units in UNITS if units <= size * max(1, size // 6)]
+
+def skirmish(size, pairs):
+    """A size x size board of player Healers each standing next to an enemy Goblin."""
+    battle_map = generate_map(size, size, units_per_side=0, obstacle_density=0)
+    slots = np.arange(pairs) * 2 # every other column, so pairs never touch
+    xs, ys = slots // size, slots % size
+    battle_map.bulk_add_units(
+        [HEALER] * pairs + [GOBLIN] * pairs, [None] * (2 * pairs),
+        {"x": np.concatenate([xs, xs]), "y": np.concatenate([ys, ys + 1]),
+         "allegiance": [allegiance_code("player")] * pairs + [allegiance_code("enemy")] * pairs})
+    return battle_map
+
+_boards = {}
+
+def cached(kind, size, units):
+    # Building a 512x512 board is slower than most benchmarks, so each is built once
+    key = (kind, size, units)
+    if key not in _boards:
+        _boards[key] = generate_map(size, size, seed=size, units_per_side=units, obstacle_density=0.1) \
+            if kind == "battle" else skirmish(size, units)
+    return _boards[key]
+
+@pytest.fixture
+def battle(size, units):
+    """A generated battle with the two armies on opposite edges. Shared: copy it before changing it."""
+    return cached("battle", size, units)
+
+@pytest.fixture
+def engaged(size, units):
+    """Adjacent Healer/Goblin pairs, for attack and skill benchmarks. Shared: copy it before changing it."""
+    return cached("skirmish", size, units)
+
+def rounds(size):
+    # Fewer rounds on the big boards, where one round already takes a while
+    return 20 if size <= 32 else 10 if size <= 128 else 3
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
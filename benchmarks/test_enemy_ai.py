@@ -0,0 +1,28 @@
+"""Easy_EnemyAI: a whole enemy turn and the per-unit path choice."""
+import pytest
+from battle_engine import distance
+from conftest import board_params, rounds
+from savegame import copy_battle
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_execute_enemy_turn(benchmark, battle, size, units):
+    def setup():
+        return (copy_battle(battle),), {}
+
+    def enemy_turn(battle_map):
+        battle_map.enemy_ai.execute_enemy_turn()
+
+    benchmark.pedantic(enemy_turn, setup=setup, rounds=rounds(size))
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_find_nearest_reachable_block(benchmark, battle, size, units):
+    # Read-only, so it runs on the shared board. Inside a turn, as during play, the
+    # distance field and threat map are built by the first call and reused after it,
+    # so this times the path choice rather than building them.
+    unit = battle.units_of("enemy")[0]
+    x, y = battle.position_of(unit)
+    target = min(battle.positions_of_hostiles("enemy"), key=lambda cell: distance(x, y, *cell))
+    ai = battle.enemy_ai
+    with ai.turn_caches():
+        ai.find_nearest_reachable_block(x, y, *target, unit.movement, unit.attack_range)
+        benchmark(ai.find_nearest_reachable_block, x, y, *target, unit.movement, unit.attack_range)
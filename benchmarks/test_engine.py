@@ -0,0 +1,59 @@
+"""BattleMap actions: move_unit, attack_unit, use_skill and end_turn."""
+import pytest
+from conftest import board_params, rounds
+from savegame import copy_battle
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_move_unit(benchmark, battle, size, units):
+    def setup():
+        battle_map = copy_battle(battle)
+        unit = battle_map.units_of("player")[0]
+        x, y = battle_map.position_of(unit)
+        end_x, end_y = list(battle_map.reachable_cells(x, y, unit.movement, "player"))[-1]
+        battle_map.reachable_memo.clear() # the move pays for its own path search
+        return (battle_map, unit, x, y, end_x, end_y), {}
+
+    def move(battle_map, unit, x, y, end_x, end_y):
+        battle_map.move_unit(unit, x, y, end_x, end_y)
+        assert battle_map.position_of(unit) == (end_x, end_y)
+
+    benchmark.pedantic(move, setup=setup, rounds=rounds(size))
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_attack_unit(benchmark, engaged, size, units):
+    def setup():
+        battle_map = copy_battle(engaged)
+        unit = battle_map.units_of("player")[0]
+        x, y = battle_map.position_of(unit)
+        return (battle_map, unit, x, y, x, y + 1), {}
+
+    def attack(battle_map, unit, x, y, target_x, target_y):
+        battle_map.attack_unit(unit, x, y, target_x, target_y)
+        assert unit.has_attacked
+
+    benchmark.pedantic(attack, setup=setup, rounds=rounds(size))
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_use_skill(benchmark, engaged, size, units):
+    def setup():
+        battle_map = copy_battle(engaged)
+        unit = battle_map.units_of("player")[0]
+        skill = next(skill for skill in unit.skills if skill.effect_type == "attack")
+        x, y = battle_map.position_of(unit)
+        return (battle_map, unit, skill, x, y, x, y + 1), {}
+
+    def cast(battle_map, unit, skill, x, y, target_x, target_y):
+        assert battle_map.use_skill(unit, skill, x, y, target_x, target_y)
+
+    benchmark.pedantic(cast, setup=setup, rounds=rounds(size))
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_end_turn(benchmark, battle, size, units):
+    def setup():
+        return (copy_battle(battle),), {}
+
+    def end_turn(battle_map):
+        battle_map.end_turn()
+        assert battle_map.turn == battle.turn + 1
+
+    benchmark.pedantic(end_turn, setup=setup, rounds=rounds(size))
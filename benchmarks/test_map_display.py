@@ -0,0 +1,31 @@
+"""MapDisplay redraws, on the offscreen Qt platform."""
+import pytest
+from conftest import board_params
+from savegame import copy_battle
+
+@pytest.fixture
+def view(qapp, battle):
+    from game_interface import MapDisplay
+    display = MapDisplay(copy_battle(battle))
+    display.show()
+    qapp.processEvents()
+    yield display
+    display.return_to_main_menu()
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_update_map_display_highlight(benchmark, qapp, view, size, units):
+    # Show and clear a unit's movement range, including painting the dirty cells
+    unit = view.battle_map.units_of("player")[0]
+
+    def highlight_and_clear():
+        view.start_action_selection("move", unit)
+        qapp.processEvents()
+        view.clear_highlight()
+        view.update_map_display()
+        qapp.processEvents()
+
+    benchmark(highlight_and_clear)
+
+@pytest.mark.parametrize("size, units", board_params())
+def test_full_repaint(benchmark, view, size, units):
+    benchmark(view.board.repaint)
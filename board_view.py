@@ -0,0 +1,211 @@
+"""Single-widget tile renderer for a BattleMap.
+
+BoardView paints the whole board in paintEvent instead of using one widget per
+cell. Only cells inside the repainted region are drawn, empty cells are filled
+in one pass, and units and highlights are blitted from the sprite atlas. An
+optional danger overlay tints each cell by a threat.ThreatMap.
+The mouse wheel zooms around the cursor; dragging with the right or middle
+button (or the arrow keys) pans.
+"""
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QRectF, QPointF, QSize, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QPen
+import sprites
+
+class BoardView(QWidget):
+    cell_clicked = pyqtSignal(object, int, int) # mouse event, row, col
+    MIN_ZOOM = 0.02
+    MAX_ZOOM = 2.0
+    GRID_LINES_FROM = 6 # cell size in pixels below which grid lines are not drawn
+    TEXT_FROM = 24 # cell size in pixels below which cell text is not drawn
+    EMPTY_COLOR = (211, 211, 211, 100)
+    OBSTACLE_COLOR = (90, 90, 90, 200)
+    DANGER_COLOR = (220, 40, 40)
+    DANGER_ALPHA = 140 # overlay alpha at DANGER_FULL damage or more
+    DANGER_FULL = 100
+
+    def __init__(self, battle_map, appearance, cell_size=100, parent=None):
+        super().__init__(parent)
+        self.battle_map = battle_map
+        self.appearance = appearance # appearance(row, col, highlight) -> (text, color, unit_type)
+        self.cell_size = cell_size
+        self.atlas = sprites.atlas(cell_size)
+        self.highlighted = {} # (row, col) -> highlight kind
+        self.threats = None # a ThreatMap while the danger overlay is shown
+        self.danger_side = "player" # side the overlay shows the danger to
+        self.zoom = 1.0
+        self.offset = QPointF(0, 0) # board pixel (at zoom 1) shown at the widget's top left
+        self.drag_start = None
+        self.auto_fit = True # keep the whole board in view until the player zooms or pans
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setMinimumSize(200, 200)
+
+    def sizeHint(self):
+        # The whole board at the current zoom, up to a comfortable window size
+        return QSize(min(self.board_width(), 800), min(self.board_height(), 800))
+
+    def board_width(self):
+        return int(self.battle_map.columns * self.cell_size * self.zoom)
+
+    def board_height(self):
+        return int(self.battle_map.rows * self.cell_size * self.zoom)
+
+    def fit(self, width, height):
+        # Zoom out so the whole board fits in width x height (never zooms in past 1)
+        board = max(self.battle_map.rows, self.battle_map.columns) * self.cell_size
+        self.zoom = max(self.MIN_ZOOM, min(1.0, width / board, height / board))
+        self.offset = QPointF(0, 0)
+        self.update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.auto_fit:
+            self.fit(self.width(), self.height())
+
+    def cell_rect(self, row, col):
+        # Widget rectangle covered by a cell
+        size = self.cell_size * self.zoom
+        return QRectF(col * self.cell_size * self.zoom - self.offset.x() * self.zoom,
+                      row * self.cell_size * self.zoom - self.offset.y() * self.zoom, size, size)
+
+    def cell_at(self, point):
+        # (row, col) under a widget point, or None outside the board
+        col = int((point.x() / self.zoom + self.offset.x()) // self.cell_size)
+        row = int((point.y() / self.zoom + self.offset.y()) // self.cell_size)
+        if 0 <= row < self.battle_map.rows and 0 <= col < self.battle_map.columns:
+            return row, col
+        return None
+
+    def visible_cells(self, rect):
+        # Row and column ranges of the cells that intersect a widget rectangle
+        size = self.cell_size * self.zoom
+        left = self.offset.x() * self.zoom + rect.left()
+        top = self.offset.y() * self.zoom + rect.top()
+        first_col = max(0, int(left // size))
+        first_row = max(0, int(top // size))
+        last_col = min(self.battle_map.columns, int((left + rect.width()) // size) + 1)
+        last_row = min(self.battle_map.rows, int((top + rect.height()) // size) + 1)
+        return first_row, last_row, first_col, last_col
+
+    def update_cell(self, row, col):
+        # Schedule a repaint of one cell; Qt merges these into a single dirty region
+        rect = self.cell_rect(row, col).toAlignedRect()
+        if rect.intersects(self.rect()):
+            self.update(rect)
+
+    def paintEvent(self, event):
+        with self.battle_map.measure("ui_paint"):
+            self.paint_board(event)
+
+    def paint_board(self, event):
+        first_row, last_row, first_col, last_col = self.visible_cells(event.rect())
+        if first_row >= last_row or first_col >= last_col:
+            return
+        painter = QPainter(self)
+        painter.setClipRegion(event.region())
+        size = self.cell_size * self.zoom
+
+        # Empty cells: one fill for the whole visible block, then the grid lines
+        top_left = self.cell_rect(first_row, first_col).topLeft()
+        block = QRectF(top_left.x(), top_left.y(), (last_col - first_col) * size, (last_row - first_row) * size)
+        painter.fillRect(block, QColor(*self.EMPTY_COLOR))
+        obstacle = QColor(*self.OBSTACLE_COLOR)
+        rows, cols = np.nonzero(~self.battle_map.passable[first_row:last_row, first_col:last_col])
+        for row, col in zip((rows + first_row).tolist(), (cols + first_col).tolist()):
+            painter.fillRect(self.cell_rect(row, col), obstacle)
+        if size >= self.GRID_LINES_FROM:
+            painter.setPen(QPen(Qt.black, 1))
+            for row in range(first_row, last_row + 1):
+                y = top_left.y() + (row - first_row) * size
+                painter.drawLine(QPointF(block.left(), y), QPointF(block.right(), y))
+            for col in range(first_col, last_col + 1):
+                x = top_left.x() + (col - first_col) * size
+                painter.drawLine(QPointF(x, block.top()), QPointF(x, block.bottom()))
+
+        # Occupied and highlighted cells are blitted from the atlas
+        rows, cols = np.nonzero(self.battle_map.unit_ids[first_row:last_row, first_col:last_col] >= 0)
+        cells = set(zip((rows + first_row).tolist(), (cols + first_col).tolist()))
+        cells.update((row, col) for row, col in self.highlighted
+                     if first_row <= row < last_row and first_col <= col < last_col)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, size < self.cell_size)
+        texts = []
+        for row, col in cells:
+            text, color, unit_type = self.appearance(row, col, self.highlighted.get((row, col)))
+            page, source = self.atlas.cell_source(color, unit_type)
+            painter.drawPixmap(self.cell_rect(row, col), page, QRectF(source))
+            if text:
+                texts.append((row, col, text))
+
+        # Text changes with HP and the like, so it is drawn here rather than kept in the atlas
+        if texts and size >= self.TEXT_FROM:
+            painter.setPen(QPen(Qt.black, 1))
+            tile = QRectF(0, 0, self.cell_size, self.cell_size)
+            for row, col, text in texts:
+                painter.save()
+                painter.translate(self.cell_rect(row, col).topLeft())
+                painter.scale(self.zoom, self.zoom) # lay the text out as on a full-size tile
+                sprites.paint_cell_text(painter, tile, text)
+                painter.restore()
+
+        # Danger overlay: a red tint growing with the damage that could reach the cell
+        if self.threats is not None:
+            danger = self.threats.danger(self.danger_side, slice(first_row, last_row), slice(first_col, last_col))
+            alpha = np.minimum(danger * self.DANGER_ALPHA // self.DANGER_FULL, self.DANGER_ALPHA)
+            rows, cols = np.nonzero(alpha)
+            for row, col, value in zip((rows + first_row).tolist(), (cols + first_col).tolist(), alpha[rows, cols].tolist()):
+                painter.fillRect(self.cell_rect(row, col), QColor(*self.DANGER_COLOR, value))
+        painter.end()
+
+    def update_block(self, first_row, last_row, first_col, last_col):
+        # Schedule a repaint of a block of cells
+        top_left = self.cell_rect(first_row, first_col).topLeft()
+        size = self.cell_size * self.zoom
+        rect = QRectF(top_left.x(), top_left.y(), (last_col - first_col) * size, (last_row - first_row) * size).toAlignedRect()
+        if rect.intersects(self.rect()):
+            self.update(rect)
+
+    def set_zoom(self, zoom, anchor):
+        # Zoom keeping the board point under `anchor` (a widget point) in place
+        zoom = max(self.MIN_ZOOM, min(self.MAX_ZOOM, zoom))
+        self.auto_fit = False
+        board_point = QPointF(anchor.x() / self.zoom + self.offset.x(), anchor.y() / self.zoom + self.offset.y())
+        self.zoom = zoom
+        self.offset = QPointF(board_point.x() - anchor.x() / zoom, board_point.y() - anchor.y() / zoom)
+        self.update()
+
+    def pan(self, dx, dy):
+        # Scroll by (dx, dy) widget pixels
+        dx, dy = int(dx), int(dy)
+        self.auto_fit = False
+        self.offset += QPointF(dx / self.zoom, dy / self.zoom)
+        self.scroll(-dx, -dy) # reuse what is already painted; only the exposed strip is repainted
+
+    def wheelEvent(self, event):
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.set_zoom(self.zoom * factor, QPointF(event.pos()))
+
+    def mousePressEvent(self, event):
+        if event.button() in (Qt.RightButton, Qt.MiddleButton):
+            self.drag_start = event.pos()
+            return
+        cell = self.cell_at(event.pos())
+        if cell is not None:
+            self.cell_clicked.emit(event, *cell)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_start is not None:
+            delta = self.drag_start - event.pos()
+            self.drag_start = event.pos()
+            self.pan(delta.x(), delta.y())
+
+    def mouseReleaseEvent(self, event):
+        self.drag_start = None
+
+    def keyPressEvent(self, event):
+        step = self.cell_size * self.zoom
+        moves = {Qt.Key_Left: (-step, 0), Qt.Key_Right: (step, 0), Qt.Key_Up: (0, -step), Qt.Key_Down: (0, step)}
+        if event.key() in moves:
+            self.pan(*moves[event.key()])
+        else:
+            super().keyPressEvent(event)
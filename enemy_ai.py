@@ -1,113 +1,478 @@
-from random import choice
-from collections import deque 
+import heapq
+import time
+from contextlib import contextmanager
+import numpy as np
+from battle_engine import BattleObserver, FRIENDLY_EFFECTS, allegiance_code, distance
+from battle_log import logger
+from threat import ThreatMap
 
 class Easy_EnemyAI:
-    def __init__(self, battle_map):
+    def __init__(self, battle_map, allegiance="enemy", rng=None):
         self.battle_map = battle_map
+        self.allegiance = allegiance # side this AI plays; "player" for AI-vs-AI simulations
+        self.rng = rng # a random.Random to break ties between targets; None always takes the first
+        self.reachability = None
+        self.threats = None
 
     def execute_enemy_turn(self):
-        # Iterate through all cells in the battle map to find enemy units
-        occupied_positions = []
-        for x in range(self.battle_map.rows):
-            for y in range(self.battle_map.columns):
-                unit = self.battle_map.grid[x][y]
-                if unit:
-                    occupied_positions.append((x, y))
-        
-        # Iterate through occupied positions and process enemy units
-        for x, y in occupied_positions:
-            unit = self.battle_map.grid[x][y]
-            if unit and unit.allegiance == "enemy":
-                self.move_and_attack(unit, x, y, occupied_positions)
-
-    def move_and_attack(self, unit, start_x, start_y, occupied_positions):
+        with self.turn_caches():
+            # Process our units straight from the map's spatial index
+            for unit in self.battle_map.units_of(self.allegiance):
+                if unit not in self.battle_map.positions:
+                    continue # defeated earlier this turn
+                with self.battle_map.measure("ai_unit"):
+                    self.move_and_attack(unit, *self.battle_map.position_of(unit))
+
+    @contextmanager
+    def turn_caches(self):
+        # Pathing data (and the threat map, once asked for) are computed once for the turn and kept up to date as units act
+        self.reachability = ReachabilityCache(self.battle_map, self.allegiance)
+        self.battle_map.add_observer(self.reachability)
+        try:
+            yield
+        finally:
+            self.battle_map.remove_observer(self.reachability)
+            self.reachability = None
+            if self.threats is not None:
+                self.threats.detach()
+                self.threats = None
+
+    def move_and_attack(self, unit, start_x, start_y):
         # Updated movement and attack logic
         target = None
         # move_and_attack_range = unit.movement + unit.attack_range
         chosen_enemy = []
 
-        # find available enemy to attack
-        for x,y in occupied_positions:
-            unit_in_block = self.battle_map.grid[x][y]
-            if unit_in_block and self.battle_map.is_within_bounds(unit,start_x,start_y,x,y) and unit_in_block.allegiance != "enemy":
-                target=(x,y)
-                chosen_enemy.append(target)
+        # find available enemy to attack, using the same range query as the UI highlighting
+        chosen_enemy.extend(self.battle_map.cells_in_range(start_x, start_y, unit.attack_range, "attack"))
         if chosen_enemy:
-            print(f"Enemy: {occupied_positions},{chosen_enemy}")
+            logger.debug("Enemy: %s", chosen_enemy)
         else: # find nearest enemy
             # No enemies within range; find the closest enemy
             closest_distance = float('inf')
-            closest_unit = None
+            closest_units = []
 
-            for x,y in occupied_positions:
-                unit_in_block = self.battle_map.grid[x][y]
-                if unit_in_block and unit_in_block.allegiance != "enemy":
-                    print(f"enemy's target:{unit_in_block.name}")
-                    distance = abs(x - start_x) + abs(y - start_y)
-                    if distance < closest_distance:
-                        closest_distance = distance
-                        closest_unit = (x, y)
+            for x,y in self.battle_map.positions_of_hostiles(self.allegiance):
+                gap = distance(x, y, start_x, start_y)
+                if gap < closest_distance:
+                    closest_distance = gap
+                    closest_units = [(x, y)]
+                elif gap == closest_distance:
+                    closest_units.append((x, y))
 
-            if closest_unit:
-                chosen_enemy.append(closest_unit)
+            if closest_units:
+                chosen_enemy.append(self.pick(closest_units))
 
 
         # move and attack the nearest enemy
         if chosen_enemy:                
-            x,y = chosen_enemy[0] # for simple AI, find the first one in range
+            x,y = self.pick(chosen_enemy) # for simple AI, any one in range
             if self.battle_map.able_to_attack(unit, start_x, start_y, x, y): # if don't need to move
-                print(f"enemy going to attack :{unit.name}")
+                logger.debug("enemy going to attack :%s", unit.name)
                 self.battle_map.attack_unit(unit, start_x, start_y, x, y)
             else: #move closer to that unit and try to attack
-                nearest_block = self.find_nearest_reachable_block(start_x, start_y, x, y, unit.movement, unit.attack_range, occupied_positions)
+                nearest_block = self.find_nearest_reachable_block(start_x, start_y, x, y, unit.movement, unit.attack_range)
                 if nearest_block:
                     dx, dy = nearest_block
-                    print(f"enemy going to move close:{unit.name}")
+                    logger.debug("enemy going to move close:%s", unit.name)
                     self.battle_map.move_unit(unit, start_x, start_y, dx, dy)
                     self.battle_map.attack_unit(unit, dx, dy, x, y)        
 
+    def pick(self, cells):
+        # The first cell, or a random one when the AI has an rng
+        return cells[0] if self.rng is None else self.rng.choice(cells)
+
     def is_within_bounds(self, new_position):
         # Check if the given coordinates are within the map bounds
         return 0 <= new_position[0] < self.battle_map.rows and 0 <= new_position[1] < self.battle_map.columns
     
-    def find_nearest_reachable_block(self, start_x, start_y, target_x, target_y, movement_range, attack_range, occupied_positions):
-        
-        def distance(current_position, target):
-            """Calculate Manhattan distance between two positions."""
-            return abs(target[0] - current_position[0]) + abs(target[1] - current_position[1])
-
-        enemy_position = (target_x,target_y)
-        unit_position = (start_x, start_y)
-        # Initialize BFS for finding reachable positions within movement range
-        queue = deque([(unit_position, 0)])
-        visited = set([unit_position])
+    def reachability_cache(self):
+        # The per-turn cache while a turn is running, otherwise a throwaway one for the current board
+        return self.reachability or ReachabilityCache(self.battle_map, self.allegiance)
+
+    def threat_map(self):
+        # Built on first use in a turn and then kept up to date like the cache; a throwaway one outside a turn
+        if self.threats is None:
+            if self.reachability is None:
+                return ThreatMap(self.battle_map, attach=False)
+            self.threats = ThreatMap(self.battle_map)
+        return self.threats
+
+    def find_nearest_reachable_block(self, start_x, start_y, target_x, target_y, movement_range, attack_range):
+        field = self.reachability_cache().field(self.battle_map.positions_of_hostiles(self.allegiance))
+        threats = self.threat_map()
+        # Only accept moves that get closer to the targets than staying put; among equal ones take the least dangerous
         best_move = None
-        farthest_distance = 9999999  # Track the farthest valid block within movement range
+        best_key = (field.distance(start_x, start_y), distance(start_x, start_y, target_x, target_y), threats.danger_at(self.allegiance, start_x, start_y))
+        best_attack, least_danger = None, None
 
-        while queue:
-            current_position, current_distance = queue.popleft()
-            
-            # Check if we've reached maximum movement range
-            if current_distance > movement_range:
+        for position in self.battle_map.reachable_cells(start_x, start_y, movement_range, self.allegiance):
+            danger = threats.danger_at(self.allegiance, *position)
+            # Check if within attack range of the target, keeping the safest such block
+            if distance(*position, target_x, target_y) <= attack_range:
+                if best_attack is None or danger < least_danger:
+                    best_attack, least_danger = position, danger
                 continue
-            
-            # Check if within attack range of the target
-            if distance(current_position, enemy_position) <= attack_range:
-                return current_position  # Return immediately if a block to attack is found
-            
-            # Update the best move if closer to the target and within bounds
-            target_distance = distance(current_position, enemy_position)
-            if target_distance < distance(unit_position, enemy_position) and target_distance < farthest_distance:
-                best_move = current_position
-                farthest_distance = target_distance
-            
-            # Explore neighbors within bounds and not occupied
-            x, y = current_position
-            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                new_position = (x + dx, y + dy)
-                if new_position not in visited and self.is_within_bounds(new_position) and new_position not in occupied_positions:
-                    visited.add(new_position)
-                    queue.append((new_position, current_distance + 1))
-        
+            key = (field.distance(*position), distance(*position, target_x, target_y), danger)
+            if key < best_key:
+                best_move, best_key = position, key
+
         # If no attack position was found, return the best available move to approach the target
-        return best_move
\ No newline at end of file
+        return best_attack or best_move
+
+UNREACHABLE = 1 << 30
+
+class DistanceField:
+    """Walking distance from every cell to the nearest cell of a target set.
+
+    Impassable terrain and units hostile to `allegiance` block movement, the AI's
+    own units can be walked through (the same rules as BattleMap.reachable_cells). Removing a target or freeing a blocked cell repairs only the
+    affected cells instead of recomputing the whole field.
+    """
+
+    def __init__(self, battle_map, targets, allegiance):
+        self.rows = battle_map.rows
+        self.columns = battle_map.columns
+        unit_ids = battle_map.unit_ids
+        hostile = (unit_ids >= 0) & (battle_map.unit_table.allegiance[unit_ids] != allegiance_code(allegiance))
+        self.blocked = (hostile | ~battle_map.passable).ravel().tolist()
+        self.dist = [UNREACHABLE] * (self.rows * self.columns)
+        self.owner = [-1] * (self.rows * self.columns) # target cell each distance was measured from
+        self.targets = set()
+        for x, y in targets:
+            cell = x * self.columns + y
+            self.targets.add(cell)
+            self.dist[cell] = 0
+            self.owner[cell] = cell
+        self.relax([(0, cell) for cell in self.targets])
+
+    def distance(self, x, y):
+        return self.dist[x * self.columns + y]
+
+    def neighbours(self, cell):
+        x, y = divmod(cell, self.columns)
+        if x > 0: yield cell - self.columns
+        if x < self.rows - 1: yield cell + self.columns
+        if y > 0: yield cell - 1
+        if y < self.columns - 1: yield cell + 1
+
+    def relax(self, seeds):
+        # Propagate distance decreases outwards from (distance, cell) seeds
+        heap = list(seeds)
+        heapq.heapify(heap)
+        dist, owner, blocked, targets = self.dist, self.owner, self.blocked, self.targets
+        while heap:
+            d, cell = heapq.heappop(heap)
+            if d > dist[cell]:
+                continue
+            for neighbour in self.neighbours(cell):
+                if d + 1 < dist[neighbour] and not (blocked[neighbour] and neighbour not in targets):
+                    dist[neighbour] = d + 1
+                    owner[neighbour] = owner[cell]
+                    heapq.heappush(heap, (d + 1, neighbour))
+
+    def remove_target(self, x, y):
+        # A target died: forget every distance measured from it, then refill from the rest
+        cell = x * self.columns + y
+        self.targets.discard(cell)
+        self.blocked[cell] = False
+        orphans = [cell]
+        self.dist[cell] = UNREACHABLE
+        for orphan in orphans:
+            for neighbour in self.neighbours(orphan):
+                if self.owner[neighbour] == cell and self.dist[neighbour] != UNREACHABLE:
+                    self.dist[neighbour] = UNREACHABLE
+                    orphans.append(neighbour)
+        seeds = set()
+        for orphan in orphans:
+            self.owner[orphan] = -1
+            for neighbour in self.neighbours(orphan):
+                if self.dist[neighbour] != UNREACHABLE:
+                    seeds.add((self.dist[neighbour], neighbour))
+        self.relax(seeds)
+
+    def unblock(self, x, y):
+        # A blocking unit left or died: distances can only shrink around the freed cell
+        cell = x * self.columns + y
+        self.blocked[cell] = False
+        self.relax([(self.dist[neighbour], neighbour) for neighbour in self.neighbours(cell)
+                    if self.dist[neighbour] != UNREACHABLE])
+
+class ReachabilityCache(BattleObserver):
+    """Distance fields shared by all units of one AI during a turn, keyed by target set.
+
+    Registered as an observer for the length of the turn so fields follow the
+    board: a defeated unit is removed from (or unblocked in) each field in
+    place. Moves by the AI's own units never change a field, since its units do
+    not block each other; a hostile unit moving drops the fields for rebuilding.
+    """
+
+    def __init__(self, battle_map, allegiance):
+        self.battle_map = battle_map
+        self.allegiance = allegiance
+        self.fields = {}
+
+    def field(self, targets):
+        key = frozenset(targets)
+        if key not in self.fields:
+            self.fields[key] = DistanceField(self.battle_map, key, self.allegiance)
+            if self.battle_map.metrics is not None:
+                self.battle_map.metrics.count("distance_fields")
+        return self.fields[key]
+
+    def on_unit_moved(self, battle_map, unit, start_x, start_y, end_x, end_y):
+        if unit.allegiance != self.allegiance:
+            self.fields.clear()
+
+    def on_unit_defeated(self, battle_map, unit, x, y):
+        if unit.allegiance == self.allegiance:
+            return
+        fields, self.fields = self.fields, {}
+        for key, field in fields.items():
+            if (x, y) in key:
+                field.remove_target(x, y)
+                key = key - {(x, y)}
+            else:
+                field.unblock(x, y)
+            self.fields[key] = field
+
+class SearchTimeout(Exception):
+    """Raised inside Hard_EnemyAI's search when the time budget runs out."""
+
+WIN = 1 << 20 # score of a won position, beyond any material balance
+
+class Hard_EnemyAI:
+    """Alpha-beta search over unit actions with a hard per-turn time budget.
+
+    A ply is one unit's action: an optional move followed by an optional attack
+    or skill. Our units act in army order, then the opponent's units reply, and
+    so on. Each unit's action is chosen by iterative deepening, trying branches
+    on the live map inside BattleMap.lookahead() and undoing them from its
+    journal. Results go into a transposition table for the rest of the turn.
+    The turn's budget is shared between the units still to act, and units left
+    when it runs out only attack what is already in range, so a turn never
+    takes much longer than time_budget seconds however large the map is.
+    """
+    MAX_DEPTH = 32
+    MOVE_CANDIDATES = 3 # plain moves kept per unit, best approach first
+    DESTINATIONS_PER_TARGET = 2 # cells an attack or skill on the same target may be made from
+    UNIT_VALUE = 30 # score of a live unit on top of its HP
+    APPROACH_PAIRS = 10000 # skip the distance term on boards with more unit pairs than this
+    TABLE_SIZE = 200000
+
+    def __init__(self, battle_map, allegiance="enemy", time_budget=1.0, rng=None):
+        self.battle_map = battle_map
+        self.allegiance = allegiance
+        self.rng = rng # a random.Random to shuffle equally ranked candidate actions; None keeps them in board order
+        self.opponent = "enemy" if allegiance == "player" else "player"
+        self.time_budget = time_budget
+        self.deadline = None
+        self.transpositions = {}
+        self.nodes = 0
+
+    def execute_enemy_turn(self):
+        battle_map = self.battle_map
+        turn_deadline = time.perf_counter() + self.time_budget
+        self.transpositions.clear()
+        units = battle_map.units_of(self.allegiance)
+        for index, unit in enumerate(units):
+            if unit not in battle_map.positions:
+                continue # defeated earlier this turn
+            if battle_map.winner is not None:
+                break
+            with battle_map.measure("ai_unit"):
+                now = time.perf_counter()
+                pending = tuple(other for other in units[index:] if other in battle_map.positions)
+                action = None
+                nodes = self.nodes
+                if now < turn_deadline:
+                    action = self.choose_action(pending, now + (turn_deadline - now) / len(pending))
+                if battle_map.metrics is not None:
+                    battle_map.metrics.count("search_nodes", self.nodes - nodes)
+                if action is None:
+                    action = self.attack_in_place(unit)
+                self.play(unit, action)
+
+    def choose_action(self, pending, deadline):
+        # Iterative deepening: keep the best action of the deepest search that finished in time
+        self.deadline = deadline
+        best = None
+        with self.battle_map.lookahead():
+            for depth in range(1, self.MAX_DEPTH + 1):
+                try:
+                    value, action = self.search(self.allegiance, pending, depth, -WIN - 1, WIN + 1)
+                except SearchTimeout:
+                    break
+                best = action
+                logger.debug("Depth %s: %s (%s), %s nodes", depth, action, value, self.nodes)
+                if abs(value) >= WIN:
+                    break # the outcome is already decided
+        return best
+
+    def attack_in_place(self, unit):
+        # Fallback once the budget is spent: hit something already in range, without moving
+        position = self.battle_map.position_of(unit)
+        targets = self.battle_map.cells_in_range(*position, unit.attack_range, "attack")
+        return (position, "attack", targets[0], None) if targets else (position, None, None, None)
+
+    def play(self, unit, action):
+        # Carry out (destination, kind, target, skill) through the engine
+        battle_map = self.battle_map
+        (start_x, start_y), (end_x, end_y) = battle_map.position_of(unit), action[0]
+        kind, target, skill = action[1:]
+        if (end_x, end_y) != (start_x, start_y):
+            battle_map.move_unit(unit, start_x, start_y, end_x, end_y)
+        if kind == "attack":
+            battle_map.attack_unit(unit, end_x, end_y, *target)
+        elif kind == "skill":
+            battle_map.use_skill(unit, skill, end_x, end_y, *target)
+
+    def position_key(self, side, pending):
+        # Identifies the board (by its Zobrist hash) and who acts next, for the transposition table
+        return (self.battle_map.zobrist, side, tuple(unit._index for unit in pending))
+
+    def next_to_act(self, side, pending):
+        # Skip defeated units; when a side has no one left to act the other side's phase begins
+        battle_map = self.battle_map
+        pending = tuple(unit for unit in pending if unit in battle_map.positions)
+        if pending:
+            return side, pending
+        side = self.opponent if side == self.allegiance else self.allegiance
+        battle_map.reset_units_actions(side)
+        if side == self.allegiance:
+            battle_map.skill_cooldown() # a full round has passed
+        return side, tuple(battle_map.units_of(side))
+
+    def search(self, side, pending, depth, alpha, beta):
+        # Minimax with alpha-beta pruning; returns (score for self.allegiance, best action)
+        self.nodes += 1
+        if self.nodes % 64 == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        battle_map = self.battle_map
+        if battle_map.winner is not None or depth == 0:
+            return self.evaluate(), None
+        side, pending = self.next_to_act(side, pending)
+        if not pending:
+            return self.evaluate(), None
+
+        key = self.position_key(side, pending)
+        entry = self.transpositions.get(key)
+        hint = None
+        if entry is not None:
+            entry_depth, value, bound, hint = entry
+            if entry_depth >= depth and (bound == 0 or (bound < 0 and value <= alpha) or (bound > 0 and value >= beta)):
+                return value, hint
+
+        unit, rest = pending[0], pending[1:]
+        maximizing = side == self.allegiance
+        original_alpha, original_beta = alpha, beta
+        best_value, best_action = (-WIN - 1 if maximizing else WIN + 1), None
+        for action in self.actions(unit, side, hint):
+            marker = battle_map.checkpoint()
+            self.play(unit, action)
+            try:
+                value = self.search(side, rest, depth - 1, alpha, beta)[0]
+            finally:
+                battle_map.rollback(marker)
+            if maximizing and value > best_value:
+                best_value, best_action = value, action
+                alpha = max(alpha, value)
+            elif not maximizing and value < best_value:
+                best_value, best_action = value, action
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        # bound: -1 = upper bound (failed low), 1 = lower bound (failed high), 0 = exact
+        if best_value <= original_alpha:
+            bound = -1
+        elif best_value >= original_beta:
+            bound = 1
+        else:
+            bound = 0
+        if len(self.transpositions) >= self.TABLE_SIZE:
+            self.transpositions.clear()
+        self.transpositions[key] = (depth, best_value, bound, best_action)
+        return best_value, best_action
+
+    def actions(self, unit, side, hint=None):
+        """Candidate (destination, kind, target, skill) actions for unit, most promising first.
+
+        Attacks, and attack or heal skills whose cooldown is over, are tried from
+        a few of the reachable cells each. Plain moves are limited to the ones
+        that best approach the opponent, plus waiting in place.
+        """
+        battle_map = self.battle_map
+        x, y = battle_map.position_of(unit)
+        destinations = [(x, y)]
+        if not unit.has_moved:
+            destinations.extend(battle_map.reachable_cells(x, y, unit.movement, unit.allegiance))
+        hostiles = battle_map.positions_of_hostiles(unit.allegiance)
+        skills = [skill for skill in unit.skills
+                  if skill.turns_until_ready == 0 and skill.effect_type in ("attack", "heal")]
+        reach = max([unit.attack_range] + [skill.range for skill in skills])
+        near = [cell for cell in hostiles if distance(x, y, *cell) <= unit.movement + reach]
+        allies = [battle_map.positions[ally] for ally in battle_map.armies.get(side, ())
+                  if ally.hp < ally.max_hp] if any(skill.effect_type in FRIENDLY_EFFECTS for skill in skills) else []
+
+        strikes = {} # (kind, target, skill) -> [(priority, action)]
+        for destination in destinations:
+            options = []
+            if not unit.has_attacked:
+                options.extend(("attack", cell, None, unit.atk) for cell in near
+                               if distance(*destination, *cell) <= unit.attack_range)
+            for skill in skills:
+                if skill.effect_type in FRIENDLY_EFFECTS:
+                    # allies are looked up where they stand now; the unit itself heals from its destination
+                    cells = [destination if cell == (x, y) else cell for cell in allies]
+                else:
+                    cells = near
+                options.extend(("skill", cell, skill, skill.damage) for cell in cells
+                               if distance(*destination, *cell) <= skill.range)
+            for kind, cell, skill, amount in options:
+                found = strikes.setdefault((kind, cell, skill), [])
+                if len(found) < self.DESTINATIONS_PER_TARGET:
+                    target = battle_map.grid[cell] if cell != destination else unit
+                    kills = skill is None or skill.effect_type not in FRIENDLY_EFFECTS
+                    priority = (2 if kills and target.hp <= amount else 1, amount)
+                    found.append((priority, (destination, kind, cell, skill)))
+
+        ranked = [entry for found in strikes.values() for entry in found]
+        if self.rng is not None:
+            self.rng.shuffle(ranked) # the sort is stable, so this only reorders ties
+        ranked.sort(key=lambda entry: entry[0], reverse=True)
+        actions = [action for _, action in ranked]
+        if hostiles:
+            def approach(cell):
+                return min(distance(*cell, *hostile) for hostile in (near or hostiles))
+            moves = sorted(destinations[1:], key=approach)[:self.MOVE_CANDIDATES]
+        else:
+            moves = []
+        actions.extend((cell, None, None, None) for cell in moves)
+        actions.append(((x, y), None, None, None))
+        if hint in actions:
+            actions.remove(hint)
+            actions.insert(0, hint)
+        return actions
+
+    def evaluate(self):
+        """Score the board for self.allegiance: HP and units alive, ours minus theirs,
+        less a small penalty for how far our units are from the nearest enemy."""
+        battle_map = self.battle_map
+        if battle_map.winner is not None:
+            return WIN if battle_map.winner == self.allegiance else -WIN
+        table = battle_map.unit_table
+        size = table.size
+        alive = table.alive[:size]
+        ours = alive & (table.allegiance[:size] == allegiance_code(self.allegiance))
+        theirs = alive & ~ours
+        worth = np.maximum(table.hp[:size], 0) + self.UNIT_VALUE
+        score = int(worth[ours].sum()) - int(worth[theirs].sum())
+        if 0 < ours.sum() * theirs.sum() <= self.APPROACH_PAIRS:
+            gaps = (np.abs(table.x[:size][ours][:, None] - table.x[:size][theirs][None, :])
+                    + np.abs(table.y[:size][ours][:, None] - table.y[:size][theirs][None, :]))
+            score -= int(gaps.min(axis=1).sum())
+        return score
+
+# AI policies selectable by name, e.g. from the batch simulator command line
+AI_POLICIES = {"easy": Easy_EnemyAI, "hard": Hard_EnemyAI}
@@ -1,8 +1,12 @@
-import sys, os
-from PyQt5.QtWidgets import QApplication, QWidget, QGridLayout, QLabel, QPushButton, QVBoxLayout, QMessageBox, QInputDialog, QDialog, QTextEdit,  QRadioButton, QButtonGroup
-from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QPixmap
-from myslg import BattleMap, Unit, Skill, Passive_skill
+import sys
+from collections import deque
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QMessageBox, QInputDialog, QDialog, QTextEdit,  QRadioButton, QButtonGroup, QFileDialog
+from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+from myslg import BattleMap, Unit, Skill, Passive_skill, QtBattleMap, EnemyTurnWorker, apply_action
+from savegame import save_battle
+from board_view import BoardView
+from threat import ThreatMap
+import sprites
 
 class UnitActionDialog(QDialog):
     def __init__(self, unit, parent=None):
@@ -79,10 +83,8 @@ class UnitActionDialog(QDialog):
         self.parent().start_action_selection("skill", unit, played_skill=skill)
 
     def wait_unit(self):
-        self.unit.has_moved = True
-        self.unit.has_attacked = True
+        self.parent().battle_map.wait_unit(self.unit)
         self.done(0)
-        print(self.unit.name + " wait in this turn.")
 
     def cancel(self):
         self.done(0)
@@ -137,118 +139,168 @@ class SkillSelectionDialog(QDialog):
 
 class MapDisplay(QWidget):
     return_to_main_menu_signal = pyqtSignal()
+    ANIMATION_MS = 300 # delay between animated enemy actions
+    CELL_SIZE = 100
     def __init__(self, battle_map):
         super().__init__()        
         self.battle_map = battle_map
         self.selected_unit = None
         self.action_type = None
         self.selected_skill = None
-        self.highlighted_cells = []
+        self.highlighted_cells = {} # (row, col) -> action type currently drawn highlighted
+        self.dirty_cells = set() # cells whose highlight was cleared, redrawn on the next update_map_display
+        # Enemy turn in progress: the worker computing it and the actions waiting to be animated
+        self.enemy_turn = None
+        self.enemy_turn_done = False # set when the worker's finished signal arrives, after all its actions
+        self.pending_actions = deque()
+        self.animation_timer = QTimer(self)
+        self.animation_timer.timeout.connect(self.play_next_action)
 
         # Show gameover popup if condition is met
-        self.battle_map.game_over_signal.connect(self.gameover_popup)
+        self.qt_battle_map = QtBattleMap(battle_map, self)
+        self.qt_battle_map.game_over_signal.connect(self.gameover_popup)
 
 
-        # Set the update callback to refresh the map after each action
-        self.battle_map.set_update_callback(self.update_map_display)
+        # Redraw just the cells each engine action changed
+        self.battle_map.set_update_callback(self.apply_changes)
 
 
         # Initialize the UI layout
         self.init_ui()
 
         # set background image
-        image = os.path.join(os.path.dirname(__file__), "images", "background", f"{battle_map.territory}.png")
-        self.set_background_image(image)
+        self.set_background_image(battle_map.territory)
 
 
     def init_ui(self):
         self.setWindowTitle("Battle Map")
         self.layout = QVBoxLayout()
        
-        # Create a grid layout for the map
-        self.grid_layout = QGridLayout()
-        self.update_map_display()
+        # The map is painted by a single widget; large maps start zoomed out to fit
+        self.board = BoardView(self.battle_map, self.cell_appearance, self.CELL_SIZE, self)
+        self.board.cell_clicked.connect(self.cell_clicked)
+        self.board.fit(800, 800)
        
         # End Turn button
-        end_turn_button = QPushButton("End Turn")
-        end_turn_button.clicked.connect(self.end_turn)
-
-
-        self.layout.addLayout(self.grid_layout)
-        self.layout.addWidget(end_turn_button)
+        self.end_turn_button = QPushButton("End Turn")
+        self.end_turn_button.clicked.connect(self.end_turn)
+
+        # Shown while the enemy is acting
+        self.skip_button = QPushButton("Skip Animation")
+        self.skip_button.clicked.connect(self.skip_animation)
+        self.skip_button.hide()
+        self.cancel_turn_button = QPushButton("Cancel Enemy Turn")
+        self.cancel_turn_button.clicked.connect(self.cancel_enemy_turn)
+        self.cancel_turn_button.hide()
+
+        # Tints the cells the enemy could hit next turn
+        self.danger_button = QPushButton("Show Danger")
+        self.danger_button.setCheckable(True)
+        self.danger_button.toggled.connect(self.show_danger)
+
+        # Save button, disabled while the enemy acts: a save only holds whole turns
+        self.save_button = QPushButton("Save")
+        self.save_button.clicked.connect(self.save_game)
+
+
+        self.layout.addWidget(self.board, 1)
+        self.layout.addWidget(self.end_turn_button)
+        self.layout.addWidget(self.skip_button)
+        self.layout.addWidget(self.cancel_turn_button)
+        self.layout.addWidget(self.danger_button)
+        self.layout.addWidget(self.save_button)
         self.setLayout(self.layout)
 
-    def set_background_image(self, image_path):
-        # Create a QLabel for the background image
+    def set_background_image(self, territory):
+        # Create a QLabel for the background image, drawn from the shared sprite cache
+        self.territory = territory
         self.background_label = QLabel(self)
-        pixmap = QPixmap(image_path)
-        self.background_label.setPixmap(pixmap)
-        self.background_label.setScaledContents(True)  # Adjust image to fit the widget size
-        self.background_label.resize(self.size())  # Cover the widget
+        self.resize_background()
         self.background_label.lower()  # Send to the bottom layer
-        print(f"Background image set to {image_path}")
+        print(f"Background image set to {sprites.terrain_name(territory)}")
+
+    def resize_background(self):
+        # Cover the widget with the background pre-scaled to its size (scaled once per size)
+        self.background_label.setPixmap(sprites.background(self.territory, self.width(), self.height()))
+        self.background_label.resize(self.size())
 
     def resizeEvent(self, event):
         super(MapDisplay, self).resizeEvent(event)
         # Ensure the background resizes with the window
-        self.background_label.resize(self.size())
-
-
-    def update_map_display(self, action_type="other", highlight_range=False, range_value=0, origin_x=None, origin_y=None, using_skill=None):
-        # Clear existing widgets in the grid layout without setting it again
-        while self.grid_layout.count():
-            item = self.grid_layout.takeAt(0)
-            widget = item.widget()
-            if widget is not None:
-                widget.deleteLater()
-
-
-        # Populate the grid layout based on the battle map
-        for row in range(self.battle_map.rows):
-            for col in range(self.battle_map.columns):
-                unit = self.battle_map.grid[row][col]
-                if unit:
-                    cell_text = f"{unit.name}\nHP: {unit.hp}/{unit.max_hp}\n{unit.allegiance}"
-                    color = "rgba(173, 216, 230, 150)" if unit.allegiance == "player" else "rgba(240, 128, 128, 150)"
-                else:
-                    cell_text = ""
-                    color = "rgba(211, 211, 211, 100)"  # Light grey with transparency
-
-                label = QLabel(cell_text)
-                label.setAlignment(Qt.AlignCenter)
-                label.setStyleSheet(f"background-color: {color}; border: 1px solid black; padding: 5px;")
-                label.setFixedSize(100, 100)
-
-
-                # Check if we should highlight cells in range
-                if highlight_range and self.is_within_range(origin_x, origin_y, row, col, range_value):
-                    if action_type == "move":
-                        label.setStyleSheet("background-color: rgba(144, 238, 144, 150); border: 1px solid black; padding: 5px;")
-                    elif action_type == "attack":
-                        label.setStyleSheet("background-color: rgba(255, 182, 193, 150); border: 1px solid black; padding: 5px;")
-                    else:
-                        label.setStyleSheet("background-color: rgba(173, 216, 230, 150); border: 1px solid black; padding: 5px;")
-                    self.highlighted_cells.append((label, row, col))
-
-
-                # Add click event
-                label.mousePressEvent = lambda event, row=row, col=col: self.cell_clicked(event, row, col, skill=using_skill)
-
-
-                # Add the label to the grid layout
-                self.grid_layout.addWidget(label, row, col)
-
-
-
-    def cell_clicked(self, event, row, col, skill=None):
+        self.resize_background()
+
+
+    def apply_changes(self, changes):
+        # Update callback: called by the engine with the ChangeSet of every action
+        with self.battle_map.measure("ui_update"):
+            for row, col in changes.cells:
+                self.board.update_cell(row, col)
+
+    def show_danger(self, shown):
+        # Toggle the danger overlay; while shown a ThreatMap follows the board and repaints the blocks it changes
+        if shown:
+            self.board.threats = ThreatMap(self.battle_map, on_update=self.update_danger)
+        elif self.board.threats is not None:
+            self.board.threats.detach()
+            self.board.threats = None
+        self.board.update()
+
+    def update_danger(self, blocks):
+        for block in blocks:
+            self.board.update_block(*block)
+
+    def cell_appearance(self, row, col, highlight):
+        # Text, RGBA fill and unit type for one cell; the fill and unit type pick its tile in the sprite atlas
+        unit = self.battle_map.grid[row, col]
+        if unit:
+            cell_text = f"{unit.name}\nHP: {unit.hp}/{unit.max_hp}\n{unit.allegiance}"
+            color = (173, 216, 230, 150) if unit.allegiance == "player" else (240, 128, 128, 150)
+            unit_type = unit.unit_type
+        else:
+            cell_text = ""
+            color = (211, 211, 211, 100)  # Light grey with transparency
+            unit_type = None
+        if highlight == "move":
+            color = (144, 238, 144, 150)
+        elif highlight == "attack":
+            color = (255, 182, 193, 150)
+        elif highlight:
+            color = (173, 216, 230, 150)
+        return cell_text, color, unit_type
+
+    def update_map_display(self, action_type="other", highlight_range=False, range_value=0, origin_x=None, origin_y=None, using_skill=None, flash=None):
+        with self.battle_map.measure("ui_update"):
+            # Only the valid targets inside the range get highlighted
+            highlighted = {}
+            if highlight_range:
+                for cell in self.battle_map.cells_in_range(origin_x, origin_y, range_value, action_type, using_skill):
+                    highlighted[cell] = action_type
+            if flash:
+                highlighted.update(flash) # cells of the enemy action being animated
+
+            # Redraw cells whose highlight changed; cells the engine changed were scheduled by apply_changes
+            dirty = self.dirty_cells
+            dirty.update(self.highlighted_cells)
+            dirty.update(highlighted)
+            self.highlighted_cells = highlighted
+            self.board.highlighted = highlighted
+            for row, col in dirty:
+                self.board.update_cell(row, col)
+            dirty.clear()
+
+
+
+    def cell_clicked(self, event, row, col):
+        if self.enemy_turn is not None:
+            return # the board is not the player's while the enemy acts
         if self.action_type == "move":
             self.handle_move_click(row, col)
         elif self.action_type == "attack":
             self.handle_attack_click(row, col)
         elif self.action_type == "skill":
-            self.handle_skill_click(row, col, skill)            
+            self.handle_skill_click(row, col, self.selected_skill)            
         else:
-            unit = self.battle_map.grid[row][col]
+            unit = self.battle_map.grid[row, col]
             if event.button() == Qt.LeftButton and unit:
                 self.selected_unit = unit
                 self.show_unit_action_dialog(unit)
@@ -262,6 +314,7 @@ class MapDisplay(QWidget):
     def start_action_selection(self, action_type, unit, played_skill=None):
         self.action_type = action_type
         self.selected_unit = unit
+        self.selected_skill = played_skill
         start_x, start_y = self.find_unit_position(unit)
         if action_type == "move":
             range_value = unit.movement 
@@ -274,7 +327,7 @@ class MapDisplay(QWidget):
 
     def handle_move_click(self, row, col):
         start_x, start_y = self.find_unit_position(self.selected_unit)
-        if self.is_within_range(start_x, start_y, row, col, self.selected_unit.movement):
+        if self.battle_map.is_within_bounds(self.selected_unit, start_x, start_y, row, col): # same rule the engine and AI use
             self.battle_map.move_unit(self.selected_unit, start_x, start_y, row, col)
             self.clear_highlight()
             self.update_map_display()
@@ -313,24 +366,94 @@ class MapDisplay(QWidget):
 
     def clear_highlight(self):
         self.action_type = None
-        self.highlighted_cells.clear()
+        self.selected_skill = None
+        # Highlighted cells get redrawn plain on the next update
+        self.dirty_cells.update(self.highlighted_cells)
+        self.highlighted_cells = {}
 
 
     def find_unit_position(self, unit):
-        for x in range(self.battle_map.rows):
-            for y in range(self.battle_map.columns):
-                if self.battle_map.grid[x][y] == unit:
-                    return x, y
-        return None, None
+        return self.battle_map.position_of(unit)
 
 
     def end_turn(self):
-        # End the turn for the player and initiate enemy actions.
-        self.battle_map.end_turn()
-        self.update_map_display()  # Refresh the map after the turn ends
+        # End the turn for the player; the enemy AI runs in a worker thread and its actions are animated here.
+        if self.enemy_turn is not None:
+            return
+        self.battle_map.start_enemy_turn()
+        self.end_turn_button.setEnabled(False)
+        self.save_button.setEnabled(False)
+        self.skip_button.show()
+        self.cancel_turn_button.show()
+        self.enemy_turn = EnemyTurnWorker(self.battle_map, self)
+        self.enemy_turn_done = False
+        self.enemy_turn.action_taken.connect(self.queue_enemy_action)
+        self.enemy_turn.finished.connect(self.enemy_turn_finished)
+        self.animation_timer.start(self.ANIMATION_MS)
+        self.enemy_turn.start()
+
+    def queue_enemy_action(self, action):
+        self.pending_actions.append(action)
+
+    def enemy_turn_finished(self):
+        # Queued behind the worker's action signals, unlike isFinished(), so no action is missed
+        self.enemy_turn_done = True
+
+    def play_next_action(self):
+        # Replay one enemy action on the real map, or wrap up once the worker is done
+        if self.pending_actions:
+            action = self.pending_actions.popleft()
+            cells = apply_action(self.battle_map, action)
+            if self.enemy_turn is None:
+                return # the action ended the game
+            kind = "move" if action[0] == "move" else "attack"
+            self.update_map_display(flash={cell: kind for cell in cells})
+        elif self.enemy_turn_done:
+            self.stop_enemy_turn()
+            self.battle_map.finish_enemy_turn()
+            self.update_map_display()
+
+    def skip_animation(self):
+        # Play the remaining enemy actions as fast as they arrive
+        self.animation_timer.setInterval(0)
+
+    def cancel_enemy_turn(self):
+        # Stop the enemy AI; actions it already took are still played out
+        if self.enemy_turn is not None:
+            self.enemy_turn.requestInterruption()
+            self.skip_animation()
+
+    def stop_enemy_turn(self):
+        # Wait for the worker to stop and give the board back to the player
+        self.animation_timer.stop()
+        if self.enemy_turn is not None:
+            self.enemy_turn.requestInterruption()
+            self.enemy_turn.wait()
+            if self.battle_map.metrics is not None:
+                self.battle_map.metrics.merge(self.enemy_turn.snapshot.metrics) # the AI's own timings
+            self.enemy_turn.deleteLater()
+            self.enemy_turn = None
+        self.pending_actions.clear()
+        self.end_turn_button.setEnabled(True)
+        self.save_button.setEnabled(True)
+        self.skip_button.hide()
+        self.cancel_turn_button.hide()
+
+    def save_game(self):
+        # Write the current battle to a save file chosen by the player.
+        if self.battle_map.enemy_phase:
+            return # savegames do not store the enemy's half of a turn
+        path, _ = QFileDialog.getSaveFileName(self, "Save Game", "", "Saved battles (*.slg)")
+        if not path:
+            return
+        try:
+            save_battle(self.battle_map, path)
+        except OSError as error:
+            QMessageBox.warning(self, "Save Game", f"Could not save the game: {error}")
 
     def gameover_popup(self, alligence):
         # Show a popup with the result and return to the main menu.
+        self.stop_enemy_turn()
         if alligence == "enemy":
             QMessageBox.information(self, "Game Over", "You Win!", QMessageBox.Ok)
         elif alligence == "player":
@@ -339,6 +462,9 @@ class MapDisplay(QWidget):
 
     def return_to_main_menu(self):
         # Return to the main menu.
+        self.stop_enemy_turn()
+        self.qt_battle_map.detach()
+        self.show_danger(False)
         self.close()  # Close the current window
         self.return_to_main_menu_signal.emit()
 
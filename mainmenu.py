@@ -1,31 +1,34 @@
+import os
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QMessageBox, QDialog, QRadioButton, QButtonGroup
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QLabel, QMessageBox, QDialog, QRadioButton, QButtonGroup, QFileDialog
 from PyQt5.QtCore import Qt
 from game_interface import MapDisplay  # Import the main game interface
 from battle_maps import *
+from savegame import load_battle, SaveFormatError
+from metrics import TurnMetrics
+from replay import ActionRecorder
+
+# Set SLG_METRICS=<file> to append per-turn timings and counters of every game to that file
+METRICS_FILE = os.environ.get("SLG_METRICS")
+# Set SLG_RECORD=<file> to keep an action log of the current game there, for replay.py
+RECORD_FILE = os.environ.get("SLG_RECORD")
 
 class MapSelectionDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Select a Battle Map")
-        self.setFixedSize(300, 200)
+        self.setFixedSize(300, 80 + 30 * len(MAPS))
 
         # Layout for map options
         layout = QVBoxLayout()
 
-        # Map options using radio buttons
+        # One radio button per registered map
         self.map_options = QButtonGroup(self)
-        basic_map_button = QRadioButton("Basic Map")
-        forest_map_button = QRadioButton("Forest Map")
-        desert_map_button = QRadioButton("Desert Map")
-
-        # Adding buttons to layout and button group
-        layout.addWidget(basic_map_button)
-        layout.addWidget(forest_map_button)
-        layout.addWidget(desert_map_button)
-        self.map_options.addButton(basic_map_button)
-        self.map_options.addButton(forest_map_button)
-        self.map_options.addButton(desert_map_button)
+        for key in MAPS:
+            map_button = QRadioButton(MAP_TITLES.get(key, key))
+            map_button.map_key = key  # Attach the registry key to the button
+            layout.addWidget(map_button)
+            self.map_options.addButton(map_button)
         
         # Confirm button
         confirm_button = QPushButton("Start Game")
@@ -33,18 +36,12 @@ class MapSelectionDialog(QDialog):
         layout.addWidget(confirm_button)
 
         # Set default selection and layout
-        basic_map_button.setChecked(True)
+        self.map_options.buttons()[0].setChecked(True)
         self.setLayout(layout)
 
     def get_selected_map(self):
         """Returns the selected map function based on user choice."""
-        selected_button = self.map_options.checkedButton().text()
-        if selected_button == "Basic Map":
-            return basic_map
-        elif selected_button == "Forest Map":
-            return forest_map
-        elif selected_button == "Desert Map":
-            return desert_map
+        return MAPS[self.map_options.checkedButton().map_key]
 
 class MainMenu(QWidget):
     def __init__(self):
@@ -93,8 +90,16 @@ class MainMenu(QWidget):
 
     def start_new_game(self, selected_map_function):
         """Start a new game with the selected map."""
-        self.hide()  # Hide main menu
         battle_map = selected_map_function()  # Initialize the selected map
+        self.start_game(battle_map)
+
+    def start_game(self, battle_map):
+        """Open the game interface on battle_map."""
+        self.hide()  # Hide main menu
+        if METRICS_FILE:
+            battle_map.set_metrics(TurnMetrics(open(METRICS_FILE, "a", encoding="utf-8")))
+        if RECORD_FILE:
+            ActionRecorder(battle_map, path=RECORD_FILE)
         self.game_interface = MapDisplay(battle_map)  # Pass the map to the game interface
         self.game_interface.show()
 
@@ -104,8 +109,16 @@ class MainMenu(QWidget):
 
 
     def load_game(self):
-        QMessageBox.information(self, "Load Game", "Loading game...")
-        # Logic for loading a saved game can be added here
+        """Resume a battle from a save file."""
+        path, _ = QFileDialog.getOpenFileName(self, "Load Game", "", "Saved battles (*.slg)")
+        if not path:
+            return
+        try:
+            battle_map = load_battle(path)
+        except (SaveFormatError, OSError) as error:
+            QMessageBox.warning(self, "Load Game", f"Could not load the game: {error}")
+            return
+        self.start_game(battle_map)
 
     def open_settings(self):
         QMessageBox.information(self, "Settings", "Opening settings...")
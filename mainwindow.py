@@ -52,10 +52,8 @@ class UnitActionDialog(QDialog):
         self.parent().start_action_selection(action_type, self.unit)
 
     def wait_unit(self):
-        self.unit.has_moved = True
-        self.unit.has_attacked = True
+        self.parent().battle_map.wait_unit(self.unit)
         self.done(0)
-        print(self.unit.name + " wait in this turn.")
 
     def cancel(self):
         self.done(0)
@@ -69,8 +67,8 @@ class MapDisplay(QWidget):
         self.highlighted_cells = []
 
 
-        # Set the update callback to refresh the map after each action
-        self.battle_map.set_update_callback(self.update_map_display)
+        # Set the update callback to refresh the map after each action (this view redraws every cell)
+        self.battle_map.set_update_callback(lambda changes: self.update_map_display())
 
 
         # Initialize the UI layout
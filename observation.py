@@ -0,0 +1,112 @@
+"""Fixed-layout tensor observations of BattleMap states, for learned policies.
+
+ObservationEncoder turns a map into a (channels, rows, columns) float32
+array read straight from the engine's unit and skill tables. It never walks
+BattleMap.grid cell by cell. Channels, in order:
+
+    occupancy:<allegiance>   1 where a unit of that side stands, one per side
+    hp                       HP / max HP
+    atk, movement, attack_range
+                             the unit's stat divided by SCALES[stat]
+    has_moved, has_attacked  the unit's action flags
+    skill<n>                 readiness of the unit's n-th skill: 1 when ready,
+                             1 / (1 + turns left) while cooling down, 0 if
+                             the unit has no n-th skill
+    passable                 1 on walkable terrain
+    territory:<name>         1 everywhere on maps of that territory
+
+encode() writes into a caller's buffer when given one, and encode_batch()
+fills a (batch, channels, rows, columns) buffer for many maps at once with a
+single scatter per channel. Maps smaller than the encoder are zero-padded.
+"""
+import numpy as np
+from battle_engine import ALLEGIANCES, allegiance_code
+
+SCALES = {"atk": 50.0, "movement": 5.0, "attack_range": 5.0} # about the largest values the unit types use
+TERRITORIES = ("plain", "forest", "desert")
+
+class ObservationEncoder:
+    """Encodes maps of up to rows x columns into a fixed channel layout."""
+
+    def __init__(self, rows, columns, allegiances=("player", "enemy"), skill_slots=2, territories=TERRITORIES):
+        self.rows = rows
+        self.columns = columns
+        self.allegiances = tuple(allegiances)
+        self.skill_slots = skill_slots
+        self.territories = tuple(territories)
+        self.channels = ([f"occupancy:{name}" for name in self.allegiances]
+                         + ["hp", "atk", "movement", "attack_range", "has_moved", "has_attacked"]
+                         + [f"skill{slot}" for slot in range(skill_slots)]
+                         + ["passable"] + [f"territory:{name}" for name in self.territories])
+        self.index = {name: channel for channel, name in enumerate(self.channels)}
+        self.shape = (len(self.channels), rows, columns)
+        self.codes = [allegiance_code(name) for name in self.allegiances]
+
+    def empty(self, batch=None):
+        """A zeroed buffer for one observation, or for `batch` of them."""
+        return np.zeros(self.shape if batch is None else (batch,) + self.shape, dtype=np.float32)
+
+    def encode(self, battle_map, out=None):
+        """The observation of battle_map, written into out if given."""
+        if out is None:
+            out = self.empty()
+        self.encode_batch([battle_map], out[None])
+        return out
+
+    def encode_batch(self, battle_maps, out=None):
+        """Observations of several maps stacked along a first axis, written into out if given."""
+        if out is None:
+            out = self.empty(len(battle_maps))
+        out[:len(battle_maps)] = 0
+        units, skills = [], []
+        for batch, battle_map in enumerate(battle_maps):
+            if battle_map.rows > self.rows or battle_map.columns > self.columns:
+                raise ValueError(f"A {battle_map.rows}x{battle_map.columns} map does not fit a {self.rows}x{self.columns} encoder.")
+            units.append(self.unit_rows(battle_map, batch))
+            skills.append(self.skill_rows(battle_map, batch))
+            out[batch, self.index["passable"], :battle_map.rows, :battle_map.columns] = battle_map.passable
+            territory = self.index.get(f"territory:{battle_map.territory}")
+            if territory is not None:
+                out[batch, territory] = 1
+        if not units:
+            return out
+
+        batch, xs, ys, allegiance, *values = (np.concatenate(column) for column in zip(*units))
+        occupancy = np.full(len(ALLEGIANCES), -1) # allegiance code -> occupancy channel, -1 for sides without one
+        occupancy[self.codes] = np.arange(len(self.codes))
+        channels = occupancy[allegiance]
+        known = channels >= 0
+        out[batch[known], channels[known], xs[known], ys[known]] = 1
+        for name, value in zip(("hp", "atk", "movement", "attack_range", "has_moved", "has_attacked"), values):
+            out[batch, self.index[name], xs, ys] = value
+
+        if self.skill_slots:
+            batch, xs, ys, slots, readiness = (np.concatenate(column) for column in zip(*skills))
+            kept = slots < self.skill_slots
+            out[batch[kept], self.index["skill0"] + slots[kept], xs[kept], ys[kept]] = readiness[kept]
+        return out
+
+    def unit_rows(self, battle_map, batch):
+        # Per live unit: batch index, cell, allegiance code and the normalised per-unit channels
+        table = battle_map.unit_table
+        live = np.flatnonzero(table.alive[:table.size])
+        return (np.full(len(live), batch), table.x[live], table.y[live], table.allegiance[live].astype(np.int64),
+                table.hp[live] / np.maximum(table.max_hp[live], 1),
+                table.atk[live] / SCALES["atk"], table.movement[live] / SCALES["movement"],
+                table.attack_range[live] / SCALES["attack_range"],
+                table.has_moved[live], table.has_attacked[live])
+
+    def skill_rows(self, battle_map, batch):
+        # Per skill of a live unit: batch index, its owner's cell, its slot on the owner and its readiness
+        table, skills = battle_map.unit_table, battle_map.skill_table
+        if not self.skill_slots or not skills.size:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, empty, np.zeros(0)
+        owners = skills.owner[:skills.size]
+        held = np.flatnonzero(table.alive[owners])
+        held = held[np.argsort(owners[held], kind="stable")] # grouped by owner, in the owner's skill order
+        owners = owners[held]
+        first = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+        slots = np.arange(len(held)) - np.repeat(first, np.diff(np.r_[first, len(held)]))
+        readiness = 1.0 / (1 + np.maximum(skills.turns_until_ready[held], 0))
+        return np.full(len(held), batch), table.x[owners], table.y[owners], slots, readiness
@@ -0,0 +1,39 @@
+"""BattleObserver, the base class for everything that listens to a BattleMap.
+
+Kept apart from battle_engine so modules the engine itself imports, like
+battle_log, can subclass it too.
+"""
+
+class BattleObserver:
+    """Receives notifications from a BattleMap. Override only the hooks you need."""
+
+    def on_unit_added(self, battle_map, unit, x, y):
+        pass
+
+    def on_unit_moved(self, battle_map, unit, start_x, start_y, end_x, end_y):
+        pass
+
+    def on_unit_attacked(self, battle_map, unit, target, damage):
+        pass
+
+    def on_skill_used(self, battle_map, unit, skill, target, amount):
+        pass
+
+    def on_unit_waited(self, battle_map, unit, x, y):
+        pass
+
+    def on_unit_defeated(self, battle_map, unit, x, y):
+        pass
+
+    def on_enemy_turn_started(self, battle_map):
+        pass
+
+    def on_turn_ended(self, battle_map, turn):
+        pass
+
+    def on_game_over(self, battle_map, allegiance):
+        pass
+
+    def on_changes(self, battle_map, changes):
+        # Called once per action with its ChangeSet, after the action's other events
+        pass
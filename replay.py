@@ -0,0 +1,276 @@
+"""Deterministic action logs and fast headless replay.
+
+An ActionLog holds the position a game started from (as an in-memory
+savegame), the seed of the random module, and every state-changing call made
+after that as one row of six integers:
+
+    MOVE        x, y, end_x, end_y
+    ATTACK      x, y, target_x, target_y
+    SKILL       x, y, skill index, target_x, target_y
+    ADD         x, y, entry in the log's unit table
+    END_TURN    the player ended the turn; the enemy's actions follow as rows
+    TURN_ENDED  turn, state digest after the enemy's turn
+    WAIT        x, y: the unit there ends its actions for the turn
+
+ActionRecorder fills a log from a BattleMap's events, whoever drives it: the
+GUI, the threaded enemy turn or the simulator. Replay re-executes a log
+without Qt, without the AI and with logging muted, checks the state digest at
+every turn end, and keeps a keyframe every few turns so seek(turn) only
+replays from the nearest one.
+
+Usage:
+    python replay.py game.slglog [--seek TURN] [--keyframes N]
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import struct
+import sys
+import time
+import numpy as np
+from battle_engine import BattleObserver, Skill, SkillTemplate, Unit, UnitTemplate, shared
+from battle_log import muted
+from savegame import SaveFormatError, load_battle, padding, save_battle
+
+MOVE, ATTACK, SKILL, ADD, END_TURN, TURN_ENDED, WAIT = range(7)
+ROW_SIZE = 6
+
+MAGIC = b"SLGLOG\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sHHIQQ") # magic, version, reserved, metadata, snapshot and rows lengths
+
+class ReplayMismatch(ValueError):
+    """Raised when a replayed game stops matching the recorded one."""
+
+def state_digest(battle_map):
+    """64-bit digest of the position: turn, winner and every live unit and cooldown.
+
+    Units are ordered by cell rather than by table row, so the digest is the
+    same for a map and its save/load copy, which drops defeated units.
+    """
+    table, skills = battle_map.unit_table, battle_map.skill_table
+    live = np.flatnonzero(table.alive[:table.size])
+    cells = table.x[live].astype(np.int64) * battle_map.columns + table.y[live]
+    order = np.argsort(cells)
+    units = np.stack([cells] + [getattr(table, field)[live].astype(np.int64) for field in
+                                ("hp", "max_hp", "atk", "movement", "attack_range", "allegiance", "has_moved", "has_attacked")])[:, order]
+    owners = skills.owner[:skills.size]
+    held = np.flatnonzero(table.alive[owners])
+    owner_cells = table.x[owners[held]].astype(np.int64) * battle_map.columns + table.y[owners[held]]
+    cooldowns = skills.turns_until_ready[held][np.lexsort((held, owner_cells))].astype(np.int64)
+    digest = hashlib.blake2b(units.tobytes(), digest_size=8)
+    digest.update(cooldowns.tobytes())
+    digest.update(repr((battle_map.turn, battle_map.winner)).encode())
+    return int.from_bytes(digest.digest(), "little", signed=True)
+
+def snapshot(battle_map):
+    # The map as savegame bytes
+    buffer = io.BytesIO()
+    save_battle(battle_map, buffer)
+    return buffer.getvalue()
+
+class ActionLog:
+    """The start position, the seed and the action rows of one game."""
+
+    def __init__(self, start, seed=None, units=None, rows=None):
+        self.start = start # savegame bytes
+        self.seed = seed
+        self.units = units if units is not None else [] # ADD rows index this: [template fields, name, allegiance, stats, cooldowns]
+        self.rows = rows if rows is not None else [] # tuples while recording, an (n, ROW_SIZE) array once loaded
+
+    def append(self, kind, *values):
+        self.rows.append((kind, *values) + (0,) * (ROW_SIZE - 1 - len(values)))
+
+    def add_unit(self, unit, x, y):
+        skills = [list(skill.template) for skill in unit.skills]
+        template = unit.template
+        self.units.append([[template.unit_type, template.max_hp, template.atk, template.movement,
+                            template.attack_range, [list(skill) for skill in template.skills], template.vision],
+                           unit.name, unit.allegiance,
+                           [unit.hp, unit.max_hp, unit.atk, unit.movement, unit.attack_range, unit.has_moved, unit.has_attacked],
+                           [skills, [skill.turns_until_ready for skill in unit.skills]]])
+        self.append(ADD, x, y, len(self.units) - 1)
+
+    def build_unit(self, entry):
+        # The Unit an ADD row describes, ready for BattleMap.add_unit
+        (unit_type, max_hp, atk, movement, attack_range, skills, vision), name, allegiance, stats, (own_skills, cooldowns) = self.units[entry]
+        template = shared(UnitTemplate(unit_type, max_hp, atk, movement, attack_range,
+                                       tuple(shared(SkillTemplate(*skill)) for skill in skills), vision))
+        unit = Unit.from_template(template, name, allegiance)
+        own_skills = [shared(SkillTemplate(*skill)) for skill in own_skills]
+        if [skill.template for skill in unit.skills] != own_skills:
+            del unit.skills[:]
+            unit.skills.extend(Skill.from_template(skill) for skill in own_skills)
+        for skill, cooldown in zip(unit.skills, cooldowns):
+            skill.turns_until_ready = cooldown
+        unit.hp, unit.max_hp, unit.atk, unit.movement, unit.attack_range, unit.has_moved, unit.has_attacked = stats
+        return unit
+
+    def array(self):
+        return np.asarray(self.rows, dtype=np.int64).reshape(-1, ROW_SIZE)
+
+    def save(self, target):
+        """Write the log to a path or a binary file object."""
+        if isinstance(target, str) or hasattr(target, "__fspath__"):
+            with open(target, "wb") as stream:
+                return self.save(stream)
+        metadata = json.dumps({"seed": self.seed, "units": self.units}).encode("utf-8")
+        rows = self.array().astype("<i8").tobytes()
+        target.write(HEADER.pack(MAGIC, VERSION, 0, len(metadata), len(self.start), len(rows)))
+        for section in (metadata, self.start, rows):
+            target.write(section)
+            target.write(b"\0" * padding(len(section)))
+
+    @classmethod
+    def load(cls, source):
+        """Read a log written by save() from a path or a binary file object."""
+        if isinstance(source, str) or hasattr(source, "__fspath__"):
+            with open(source, "rb") as stream:
+                return cls.load(stream)
+        header = source.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise SaveFormatError("File is too short to be an action log.")
+        magic, version, _, metadata_size, start_size, rows_size = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise SaveFormatError("Not an action log.")
+        if version != VERSION:
+            raise SaveFormatError(f"Unsupported action log version {version}.")
+        sections = []
+        for size in (metadata_size, start_size, rows_size):
+            sections.append(source.read(size + padding(size))[:size])
+        metadata = json.loads(sections[0].decode("utf-8"))
+        rows = np.frombuffer(sections[2], dtype="<i8").reshape(-1, ROW_SIZE).astype(np.int64)
+        return cls(sections[1], metadata["seed"], metadata["units"], rows)
+
+class ActionRecorder(BattleObserver):
+    """Records every state change of a BattleMap into an ActionLog.
+
+    Attach before play starts: the log starts from the position at that time.
+    Pass path to rewrite the log file at the end of every turn, so a crash
+    still leaves the game up to its last full turn on disk.
+    """
+
+    def __init__(self, battle_map, seed=None, path=None):
+        self.battle_map = battle_map
+        self.log = ActionLog(snapshot(battle_map), seed)
+        self.path = path
+        battle_map.add_observer(self)
+
+    def detach(self):
+        self.battle_map.remove_observer(self)
+
+    def on_unit_added(self, battle_map, unit, x, y):
+        self.log.add_unit(unit, x, y)
+
+    def on_unit_moved(self, battle_map, unit, start_x, start_y, end_x, end_y):
+        self.log.append(MOVE, start_x, start_y, end_x, end_y)
+
+    def on_unit_attacked(self, battle_map, unit, target, damage):
+        self.log.append(ATTACK, *battle_map.position_of(unit), *battle_map.position_of(target))
+
+    def on_skill_used(self, battle_map, unit, skill, target, amount):
+        self.log.append(SKILL, *battle_map.position_of(unit), unit.skills.index(skill), *battle_map.position_of(target))
+
+    def on_unit_waited(self, battle_map, unit, x, y):
+        self.log.append(WAIT, x, y)
+
+    def on_enemy_turn_started(self, battle_map):
+        self.log.append(END_TURN)
+
+    def on_turn_ended(self, battle_map, turn):
+        self.log.append(TURN_ENDED, turn, state_digest(battle_map))
+        if self.path is not None:
+            self.log.save(self.path)
+
+    def on_game_over(self, battle_map, allegiance):
+        if self.path is not None:
+            self.log.save(self.path)
+
+class Replay:
+    """Re-executes an ActionLog on a private BattleMap.
+
+    `battle_map` is the replayed game, `position` the next row to apply.
+    Every keyframe_interval turns the map is saved in memory, so seeking
+    backwards or far ahead restarts from the nearest keyframe instead of the
+    first turn. With verify, a turn that ends in a different state from the
+    recorded one raises ReplayMismatch.
+    """
+
+    def __init__(self, log, keyframe_interval=10, verify=True):
+        self.log = log
+        self.rows = log.array()
+        self.keyframe_interval = keyframe_interval
+        self.verify = verify
+        self.keyframes = {} # turn -> (row position, savegame bytes)
+        self.restore(0, log.start)
+        self.keyframes[self.battle_map.turn] = (0, log.start)
+        if log.seed is not None:
+            random.seed(log.seed)
+
+    def restore(self, position, data):
+        self.battle_map = load_battle(io.BytesIO(data))
+        self.position = position
+
+    def done(self):
+        return self.position >= len(self.rows)
+
+    def step(self):
+        """Apply the next row."""
+        battle_map = self.battle_map
+        kind, x, y, a, b, c = self.rows[self.position].tolist()
+        self.position += 1
+        if kind == MOVE:
+            battle_map.move_unit(battle_map.grid[x, y], x, y, a, b)
+        elif kind == ATTACK:
+            battle_map.attack_unit(battle_map.grid[x, y], x, y, a, b)
+        elif kind == SKILL:
+            unit = battle_map.grid[x, y]
+            battle_map.use_skill(unit, unit.skills[a], x, y, b, c)
+        elif kind == ADD:
+            battle_map.add_unit(self.log.build_unit(a), x, y)
+        elif kind == WAIT:
+            battle_map.wait_unit(battle_map.grid[x, y])
+        elif kind == END_TURN:
+            battle_map.start_enemy_turn()
+        elif kind == TURN_ENDED:
+            battle_map.finish_enemy_turn()
+            if self.verify and state_digest(battle_map) != y:
+                raise ReplayMismatch(f"Turn {x} ended in a different state from the recording (row {self.position - 1}).")
+            if battle_map.turn % self.keyframe_interval == 0 and battle_map.turn not in self.keyframes:
+                self.keyframes[battle_map.turn] = (self.position, snapshot(battle_map))
+
+    def run(self, turn=None):
+        """Replay until the start of `turn` (the end of the log by default), with logging muted."""
+        with muted():
+            while not self.done() and (turn is None or self.battle_map.turn < turn):
+                self.step()
+        return self.battle_map
+
+    def seek(self, turn):
+        """The battle at the start of `turn`, replayed from the nearest keyframe at or before it."""
+        earlier = [key for key in self.keyframes if key <= turn]
+        if not earlier:
+            raise ValueError(f"The log starts at turn {min(self.keyframes)}.")
+        nearest = max(earlier)
+        if not nearest <= self.battle_map.turn <= turn:
+            self.restore(*self.keyframes[nearest])
+        return self.run(turn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded game headlessly and check it still plays out the same.")
+    parser.add_argument("log", help="action log written by ActionRecorder")
+    parser.add_argument("--seek", type=int, default=None, help="stop at the start of this turn")
+    parser.add_argument("--keyframes", type=int, default=10, help="turns between in-memory keyframes")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    replay = Replay(ActionLog.load(args.log), keyframe_interval=args.keyframes)
+    battle_map = replay.seek(args.seek) if args.seek is not None else replay.run()
+    json.dump({"turn": battle_map.turn, "winner": battle_map.winner, "rows": replay.position,
+               "seconds": time.perf_counter() - start}, sys.stdout)
+    print()
+
+if __name__ == "__main__":
+    main()
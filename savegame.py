@@ -0,0 +1,200 @@
+"""Compact, versioned binary snapshots of a BattleMap.
+
+Layout (little-endian, every section padded to 8 bytes):
+
+    magic  b"SLGSAVE\\0"
+    u16 version, u16 reserved, u32 length of the metadata
+    metadata  UTF-8 JSON: map size, turn, territory, winner, whose phase it is,
+              the enemy AI policy, allegiance names, the shared unit/skill
+              templates and the unit name table
+    units     UNIT_RECORD array, one record per live unit
+    skills    SKILL_RECORD array, one record per skill of those units
+    passable  rows * columns bytes of terrain
+
+Templates and names are stored once however many units use them, and the
+fixed-size records are read straight into the engine's tables (through a
+memory map when loading from a path) instead of rebuilding units one by one.
+
+Version 2 added the AI policy and the enemy phase; version 1 saves still load,
+with the Easy AI on the player's phase.
+"""
+import copy
+import io
+import json
+import mmap
+import random
+import struct
+import numpy as np
+from battle_engine import ALLEGIANCES, BattleMap, SkillTemplate, UnitTemplate, allegiance_code, shared
+from enemy_ai import AI_POLICIES
+
+MAGIC = b"SLGSAVE\0"
+VERSION = 2
+READABLE_VERSIONS = (1, 2)
+HEADER = struct.Struct("<8sHHI")
+
+UNIT_RECORD = np.dtype([
+    ("template", "<u4"), ("name", "<u4"),
+    ("hp", "<i4"), ("max_hp", "<i4"), ("atk", "<i4"), ("movement", "<i4"), ("attack_range", "<i4"),
+    ("x", "<i4"), ("y", "<i4"),
+    ("allegiance", "u1"), ("has_moved", "u1"), ("has_attacked", "u1"), ("reserved", "u1"),
+])
+SKILL_RECORD = np.dtype([("unit", "<u4"), ("template", "<u4"), ("turns_until_ready", "<i4")])
+
+class SaveFormatError(ValueError):
+    """Raised when a file is not a battle save this version can read."""
+
+def padding(size):
+    return -size % 8
+
+def policy_name(ai):
+    # Registry name of the AI's policy, None for one AI_POLICIES does not know
+    return next((name for name, policy in AI_POLICIES.items() if type(ai) is policy), None)
+
+def is_path(target):
+    return isinstance(target, (str, bytes)) or hasattr(target, "__fspath__")
+
+def save_battle(battle_map, target):
+    """Write battle_map to a path or a binary file object, section by section."""
+    if is_path(target):
+        with open(target, "wb") as stream:
+            return save_battle(battle_map, stream)
+
+    table = battle_map.unit_table
+    live = np.flatnonzero(table.alive[:table.size])
+    unit_templates, skill_templates, names = {}, {}, {}
+    template_column, name_column, skill_rows = [], [], []
+    for record, index in enumerate(live.tolist()):
+        unit = table.objects[index]
+        template_column.append(unit_templates.setdefault(unit.template, len(unit_templates)))
+        name_column.append(names.setdefault(unit.name, len(names)))
+        for skill in unit.skills:
+            skill_rows.append((record, skill_templates.setdefault(skill.template, len(skill_templates)), skill.turns_until_ready))
+    units = np.zeros(len(live), dtype=UNIT_RECORD)
+    units["template"] = template_column
+    units["name"] = name_column
+    for field in ("hp", "max_hp", "atk", "movement", "attack_range", "x", "y", "allegiance", "has_moved", "has_attacked"):
+        units[field] = getattr(table, field)[live]
+    skills = np.array(skill_rows, dtype=SKILL_RECORD)
+    # Template skill sets refer to skill templates by index, adding any no unit currently holds
+    unit_template_fields = [[template.unit_type, template.max_hp, template.atk, template.movement, template.attack_range,
+                             [skill_templates.setdefault(skill, len(skill_templates)) for skill in template.skills],
+                             template.vision] for template in unit_templates]
+
+    metadata = json.dumps({
+        "rows": battle_map.rows, "columns": battle_map.columns, "turn": battle_map.turn,
+        "territory": battle_map.territory, "winner": battle_map.winner, "allegiances": ALLEGIANCES,
+        "enemy_phase": battle_map.enemy_phase, "ai_policy": policy_name(battle_map.enemy_ai),
+        "unit_templates": unit_template_fields,
+        "skill_templates": [list(template) for template in skill_templates],
+        "names": list(names), "units": len(units), "skills": len(skills),
+    }).encode("utf-8")
+
+    target.write(HEADER.pack(MAGIC, VERSION, 0, len(metadata)))
+    for section in (metadata, units.tobytes(), skills.tobytes(), np.ascontiguousarray(battle_map.passable, dtype=np.uint8).tobytes()):
+        target.write(section)
+        target.write(b"\0" * padding(len(section)))
+
+def read_sections(buffer):
+    # Split a save held in a bytes-like buffer into metadata and array views over it
+    if len(buffer) < HEADER.size:
+        raise SaveFormatError("File is too short to be a battle save.")
+    magic, version, _, metadata_size = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise SaveFormatError("Not a battle save file.")
+    if version not in READABLE_VERSIONS:
+        raise SaveFormatError(f"Unsupported save version {version}.")
+    offset = HEADER.size
+    metadata = json.loads(bytes(buffer[offset:offset + metadata_size]).decode("utf-8"))
+    offset += metadata_size + padding(metadata_size)
+    arrays = []
+    for dtype, count in ((UNIT_RECORD, metadata["units"]), (SKILL_RECORD, metadata["skills"]),
+                         (np.uint8, metadata["rows"] * metadata["columns"])):
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        arrays.append(array)
+        offset += array.nbytes + padding(array.nbytes)
+    return metadata, arrays
+
+def read_stream(stream):
+    # Read a save sequentially from a file object, section by section
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SaveFormatError("File is too short to be a battle save.")
+    metadata_size = HEADER.unpack(header)[3]
+    metadata_bytes = stream.read(metadata_size + padding(metadata_size))
+    metadata = json.loads(metadata_bytes[:metadata_size].decode("utf-8"))
+    body = bytearray(header + metadata_bytes)
+    for dtype, count in ((UNIT_RECORD, metadata["units"]), (SKILL_RECORD, metadata["skills"]),
+                         (np.uint8, metadata["rows"] * metadata["columns"])):
+        size = np.dtype(dtype).itemsize * count
+        body += stream.read(size + padding(size))
+    return read_sections(body)
+
+def build_battle(metadata, units, skills, passable):
+    # Construct a BattleMap from parsed sections, filling its tables in bulk
+    # An unknown or missing policy falls back to BattleMap's default, the Easy AI
+    battle_map = BattleMap(metadata["rows"], metadata["columns"], turn=metadata["turn"], territory=metadata["territory"],
+                           ai_policy=AI_POLICIES.get(metadata.get("ai_policy")))
+    battle_map.winner = metadata["winner"]
+    battle_map.passable[:] = passable.reshape(battle_map.rows, battle_map.columns).astype(np.bool_)
+
+    # Interned, so loaded units share templates with the ones defined in code
+    skill_templates = [shared(SkillTemplate(*fields)) for fields in metadata["skill_templates"]]
+    unit_templates = [shared(UnitTemplate(unit_type, max_hp, atk, movement, attack_range,
+                                          tuple(skill_templates[index] for index in skill_indices), vision))
+                      for unit_type, max_hp, atk, movement, attack_range, skill_indices, vision in metadata["unit_templates"]]
+    names = metadata["names"]
+    codes = np.array([allegiance_code(name) for name in metadata["allegiances"]], dtype=np.int8)
+    columns = {field: units[field] for field in ("hp", "max_hp", "atk", "movement", "attack_range", "x", "y", "has_moved", "has_attacked")}
+    columns["allegiance"] = codes[units["allegiance"]]
+    battle_map.bulk_add_units(
+        [unit_templates[index] for index in units["template"].tolist()],
+        [names[index] for index in units["name"].tolist()],
+        columns,
+        skills=(skills["unit"].astype(np.int64), [skill_templates[index] for index in skills["template"].tolist()],
+                skills["turns_until_ready"]))
+    if metadata.get("enemy_phase", False):
+        battle_map.toggle_phase() # keeps the Zobrist hash in step
+    return battle_map
+
+def load_battle(source, use_mmap=True):
+    """Load a BattleMap from a path or a binary file object.
+
+    Paths are memory-mapped by default so the records are copied straight from
+    the page cache into the engine's tables; file objects are read as a stream.
+    """
+    if not is_path(source):
+        metadata, arrays = read_stream(source)
+        return build_battle(metadata, *arrays)
+    with open(source, "rb") as stream:
+        if not use_mmap:
+            metadata, arrays = read_stream(stream)
+            return build_battle(metadata, *arrays)
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            metadata, arrays = read_sections(mapped)
+            try:
+                return build_battle(metadata, *arrays)
+            finally:
+                del arrays # release the views before the map is closed
+
+def copy_battle(battle_map):
+    """Independent copy of battle_map (through an in-memory save) with a copy of its enemy AI.
+
+    Units keep their order, positions and skill order, so actions found on the
+    copy can be replayed on the original by coordinates. The AI copy shares no
+    mutable state with the original: it gets its own rng, started from the
+    original's state so it makes the same choices, and an empty transposition
+    table, since the copy's Zobrist hashes are keyed by its own table rows.
+    """
+    buffer = io.BytesIO()
+    save_battle(battle_map, buffer)
+    buffer.seek(0)
+    snapshot = load_battle(buffer)
+    ai = snapshot.enemy_ai = copy.copy(battle_map.enemy_ai)
+    ai.battle_map = snapshot
+    if ai.rng is not None:
+        ai.rng = random.Random()
+        ai.rng.setstate(battle_map.enemy_ai.rng.getstate())
+    if hasattr(ai, "transpositions"):
+        ai.transpositions = {}
+    return snapshot
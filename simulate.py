@@ -0,0 +1,169 @@
+"""Headless Monte Carlo battle simulator.
+
+Plays many AI-vs-AI games on a battle_maps factory and aggregates the results.
+Games are spread over a process pool; nothing here imports Qt.
+
+Each game's seed gives both policies their own random.Random, which they use
+to break ties between targets, so games differ where the AIs have a real
+choice. With --vary-maps, factories that take a seed (generate_map) also
+build a different map for every game. Where neither changes anything the
+games are copies of one another; the report's "distinct_games" counts the
+different final positions reached, so duplicates are not mistaken for
+independent samples.
+
+Usage:
+    python simulate.py desert_map --games 100000 --player easy --enemy easy
+"""
+import argparse
+import inspect
+import json
+import multiprocessing
+import random
+import sys
+from battle_engine import BattleObserver
+from battle_log import set_quiet
+from battle_maps import MAPS
+from enemy_ai import AI_POLICIES, Easy_EnemyAI
+from replay import state_digest
+
+class GameStats(BattleObserver):
+    """Collects damage and losses per allegiance for a single game."""
+
+    def __init__(self):
+        self.damage = {}
+        self.losses = {}
+
+    def on_unit_attacked(self, battle_map, unit, target, damage):
+        self.damage[unit.allegiance] = self.damage.get(unit.allegiance, 0) + damage
+
+    def on_skill_used(self, battle_map, unit, skill, target, amount):
+        if skill.effect_type == "attack":
+            self.damage[unit.allegiance] = self.damage.get(unit.allegiance, 0) + amount
+
+    def on_unit_defeated(self, battle_map, unit, x, y):
+        self.losses[unit.allegiance] = self.losses.get(unit.allegiance, 0) + 1
+
+def seeded(map_factory):
+    # Whether the factory takes a seed, like generate_map and its partials
+    return "seed" in inspect.signature(map_factory).parameters
+
+def play_game(map_factory, player_policy=Easy_EnemyAI, enemy_policy=Easy_EnemyAI, max_turns=200, seed=None, vary_maps=False):
+    """Play one AI-vs-AI game and return its winner (None for a draw), turns, damage and losses.
+
+    seed seeds the policies' tie-breaking (None: deterministic first choices)
+    and, with vary_maps, the map itself when the factory takes a seed.
+    """
+    battle_map = map_factory(seed=seed) if vary_maps and seed is not None and seeded(map_factory) else map_factory()
+    rngs = {side: None if seed is None else random.Random(f"{seed}:{side}") for side in ("player", "enemy")}
+    battle_map.enemy_ai = enemy_policy(battle_map, "enemy", rng=rngs["enemy"])
+    player_ai = player_policy(battle_map, "player", rng=rngs["player"])
+    stats = GameStats()
+    battle_map.add_observer(stats)
+
+    while battle_map.winner is None and battle_map.turn <= max_turns:
+        player_ai.execute_enemy_turn()
+        if battle_map.winner is not None:
+            break
+        battle_map.end_turn() # enemy policy moves here
+
+    return {"winner": battle_map.winner, "turns": battle_map.turn,
+            "damage": stats.damage, "losses": stats.losses, "digest": state_digest(battle_map)}
+
+def new_summary():
+    return {"games": 0, "wins": {}, "draws": 0, "turns_total": 0,
+            "turns_min": None, "turns_max": None, "damage_total": {}, "losses_total": {}, "outcomes": set()}
+
+def add_result(summary, result):
+    # Fold one play_game() result into a running summary
+    summary["games"] += 1
+    if result["winner"] is None:
+        summary["draws"] += 1
+    else:
+        summary["wins"][result["winner"]] = summary["wins"].get(result["winner"], 0) + 1
+    summary["outcomes"].add(result["digest"])
+    turns = result["turns"]
+    summary["turns_total"] += turns
+    summary["turns_min"] = turns if summary["turns_min"] is None else min(summary["turns_min"], turns)
+    summary["turns_max"] = turns if summary["turns_max"] is None else max(summary["turns_max"], turns)
+    for key in ("damage", "losses"):
+        totals = summary[key + "_total"]
+        for allegiance, value in result[key].items():
+            totals[allegiance] = totals.get(allegiance, 0) + value
+
+def merge_summaries(summary, other):
+    # Combine the summary of another batch of games into summary
+    summary["games"] += other["games"]
+    summary["draws"] += other["draws"]
+    summary["turns_total"] += other["turns_total"]
+    summary["outcomes"] |= other["outcomes"]
+    for bound, pick in (("turns_min", min), ("turns_max", max)):
+        values = [value for value in (summary[bound], other[bound]) if value is not None]
+        summary[bound] = pick(values) if values else None
+    for key in ("wins", "damage_total", "losses_total"):
+        for allegiance, value in other[key].items():
+            summary[key][allegiance] = summary[key].get(allegiance, 0) + value
+
+def play_batch(task):
+    # Worker entry point: play a contiguous block of seeded games and summarise them
+    map_factory, player_policy, enemy_policy, first_seed, games, max_turns, vary_maps = task
+    summary = new_summary()
+    for seed in range(first_seed, first_seed + games):
+        add_result(summary, play_game(map_factory, player_policy, enemy_policy, max_turns, seed, vary_maps))
+    return summary
+
+def report(summary):
+    """Turn a raw summary into win rates and per-game averages."""
+    games = summary["games"] or 1
+    return {
+        "games": summary["games"],
+        "distinct_games": len(summary["outcomes"]),
+        "win_rate": {side: wins / games for side, wins in summary["wins"].items()},
+        "draw_rate": summary["draws"] / games,
+        "turns": {"mean": summary["turns_total"] / games,
+                  "min": summary["turns_min"], "max": summary["turns_max"]},
+        "damage_per_game": {side: total / games for side, total in summary["damage_total"].items()},
+        "losses_per_game": {side: total / games for side, total in summary["losses_total"].items()},
+    }
+
+def simulate(map_factory, player_policy=Easy_EnemyAI, enemy_policy=Easy_EnemyAI, games=1000,
+             processes=None, max_turns=200, seed=0, batch_size=None, vary_maps=False):
+    """Play `games` headless games across a process pool and return the aggregated report.
+
+    Game i is seeded with seed + i, so results do not depend on the number of processes.
+    processes=1 plays everything in the calling process.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    batch_size = batch_size or max(1, min(1000, games // (processes * 4) or 1))
+    tasks = [(map_factory, player_policy, enemy_policy, seed + start, min(batch_size, games - start), max_turns, vary_maps)
+             for start in range(0, games, batch_size)]
+
+    summary = new_summary()
+    if processes == 1:
+        set_quiet()
+        for task in tasks:
+            merge_summaries(summary, play_batch(task))
+    else:
+        with multiprocessing.Pool(processes, initializer=set_quiet) as pool:
+            for partial in pool.imap_unordered(play_batch, tasks):
+                merge_summaries(summary, partial)
+    return report(summary)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play many headless AI-vs-AI battles and report aggregate statistics.")
+    parser.add_argument("map", choices=sorted(MAPS), help="battle_maps factory to play on")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--player", choices=sorted(AI_POLICIES), default="easy", help="policy playing the player side")
+    parser.add_argument("--enemy", choices=sorted(AI_POLICIES), default="easy", help="policy playing the enemy side")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-turns", type=int, default=200, help="games still running after this many turns are draws")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--vary-maps", action="store_true", help="build a new map per game from factories that take a seed")
+    args = parser.parse_args(argv)
+
+    result = simulate(MAPS[args.map], AI_POLICIES[args.player], AI_POLICIES[args.enemy], games=args.games,
+                      processes=args.processes, max_turns=args.max_turns, seed=args.seed, vary_maps=args.vary_maps)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,33 @@
-from myslg import Skill, Passive_skill  # Adjust imports to match your project structure
+from battle_engine import Skill, Passive_skill, SkillTemplate  # Adjust imports to match your project structure
+
+# Shared skill definitions; every Skill instance only stores its own cooldown.
+FIREBALL = SkillTemplate("Fire Ball", 50, 3, "attack", 3)
+SLASH = SkillTemplate("Slash", 35, 1, "attack", 2)
+ICE_SPEAR = SkillTemplate("Ice Spear", 35, 5, "attack", 2)
+THUNDER = SkillTemplate("Thunder", 70, 3, "attack", 6)
+WAR_CRY = SkillTemplate("War Cry", 10, 0, "buff", 4)
+HEAL = SkillTemplate("Heal", 30, 2, "heal", 3)
 
 def fireball():
-    skill = Skill("Fire Ball", 50, 3, "attack", 3)
+    skill = Skill.from_template(FIREBALL)
     return skill
 
 def slash():
-    skill = Skill("Slash", 35, 1, "attack", 2)
+    skill = Skill.from_template(SLASH)
     return skill
 
 def iceSpear():
-    skill = Skill("Ice Spear", 35, 5, "attack", 2)
+    skill = Skill.from_template(ICE_SPEAR)
     return skill
 
 def thunder():
-    skill = Skill("Thunder", 70, 3, "attack", 6)
+    skill = Skill.from_template(THUNDER)
     return skill
 
 def warCry():
-    skill = Skill("War Cry", 10, 0, "buff", 4)
+    skill = Skill.from_template(WAR_CRY)
     return skill
 
 def heal():
-    skill = Skill("Heal", 30, 2, "heal", 3)
+    skill = Skill.from_template(HEAL)
     return skill
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""Process-wide cache of terrain and unit pixmaps for the battle view.
+
+Images are decoded once per process and scaled once per size. Cell tiles
+(fill color, border and unit sprite) are painted once per color and unit
+type into a SpriteAtlas, one per cell size, so redrawing a cell is a lookup
+instead of parsing a stylesheet or a PNG. Text that changes during play, such
+as HP, is drawn over the tile by the view, so the atlas stays small.
+Needs a QApplication, like any QPixmap.
+"""
+import os
+from PyQt5.QtCore import Qt, QRect
+from PyQt5.QtGui import QPixmap, QPainter, QColor, QPen
+
+IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+DEFAULT_TERRAIN = "plain" # territories without their own image, e.g. desert, use this one
+
+_images = {} # file name -> decoded QPixmap (null if the file is missing)
+_scaled = {} # (file name, width, height) -> scaled QPixmap
+_atlases = {} # cell size -> SpriteAtlas
+
+def image(name):
+    """Decode images/<name> once per process."""
+    if name not in _images:
+        _images[name] = QPixmap(os.path.join(IMAGE_DIR, name))
+    return _images[name]
+
+def terrain_name(territory):
+    name = f"{territory}.png"
+    return name if not image(name).isNull() else f"{DEFAULT_TERRAIN}.png"
+
+def scaled(name, width, height):
+    """images/<name> scaled to width x height, computed once per size."""
+    key = (name, width, height)
+    if key not in _scaled:
+        _scaled[key] = image(name).scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    return _scaled[key]
+
+def background(territory, width, height):
+    # The battle background for a territory, pre-scaled to the view
+    return scaled(terrain_name(territory), width, height)
+
+def unit_sprite(unit_type, size):
+    # images/units/<type>.png scaled to size, or None while a unit type has no art
+    name = os.path.join("units", f"{unit_type.lower()}.png")
+    if image(name).isNull():
+        return None
+    return scaled(name, size, size)
+
+def atlas(cell_size):
+    """The process-wide SpriteAtlas for cells of cell_size pixels."""
+    if cell_size not in _atlases:
+        _atlases[cell_size] = SpriteAtlas(cell_size)
+    return _atlases[cell_size]
+
+class SpriteAtlas:
+    """Cell tiles of one size packed side by side into shared pages.
+
+    A tile is painted the first time its key is asked for. source() gives the
+    page and rectangle to blit from.
+    """
+    COLUMNS = 16 # tiles per page row
+    ROWS = 16 # page rows; a new page is started when one is full
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.pages = []
+        self.slots = {} # key -> (page index, QRect)
+
+    def source(self, key, paint):
+        """(page, rect) of the tile for key, painting it with paint(painter, rect) if it is new."""
+        slot = self.slots.get(key)
+        if slot is None:
+            count = len(self.slots)
+            page_index, position = divmod(count, self.COLUMNS * self.ROWS)
+            if page_index == len(self.pages):
+                page = QPixmap(self.COLUMNS * self.cell_size, self.ROWS * self.cell_size)
+                page.fill(Qt.transparent)
+                self.pages.append(page)
+            row, column = divmod(position, self.COLUMNS)
+            rect = QRect(column * self.cell_size, row * self.cell_size, self.cell_size, self.cell_size)
+            painter = QPainter(self.pages[page_index])
+            paint(painter, rect)
+            painter.end()
+            slot = self.slots[key] = (page_index, rect)
+        page_index, rect = slot
+        return self.pages[page_index], rect
+
+    def paint_cell(self, painter, rect, color, unit_type=None):
+        # A map cell: a translucent fill with a border and the unit's sprite if it has one
+        painter.fillRect(rect, QColor(*color))
+        painter.setPen(QPen(Qt.black, 1))
+        painter.drawRect(rect.adjusted(0, 0, -1, -1))
+        sprite = unit_sprite(unit_type, self.cell_size) if unit_type else None
+        if sprite is not None:
+            painter.drawPixmap(rect, sprite)
+
+    def cell_source(self, color, unit_type=None):
+        """(page, rect) of a map cell tile, for painting the board directly."""
+        return self.source((color, unit_type), lambda painter, rect: self.paint_cell(painter, rect, color, unit_type))
+
+def paint_cell_text(painter, rect, text):
+    # A cell's text, laid out as on a cell_size tile whose rect is given in the tile's own pixels
+    painter.drawText(rect.adjusted(5, 5, -5, -5), Qt.AlignCenter | Qt.TextWordWrap, text)
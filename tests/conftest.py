@@ -0,0 +1,10 @@
+"""Shared setup for the unit tests. Run from the repository root: pytest tests"""
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # before anything imports Qt
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from battle_log import set_quiet
+
+set_quiet()
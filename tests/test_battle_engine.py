@@ -0,0 +1,96 @@
+"""BattleMap invariants: the incremental Zobrist hash and the undo journal."""
+import logging
+import random
+import threading
+import numpy as np
+import pytest
+from battle_log import logger, set_level, set_quiet
+from battle_maps import MAPS
+from replay import ActionRecorder, Replay, snapshot
+
+def table_state(battle_map):
+    # Every column of both tables plus the board arrays, for exact comparisons
+    units, skills = battle_map.unit_table, battle_map.skill_table
+    return ([getattr(units, field)[:units.size].copy() for field in ("x", "y", "hp", "alive", "has_moved", "has_attacked")]
+            + [skills.turns_until_ready[:skills.size].copy(), battle_map.unit_ids.copy()])
+
+def play_player_turn(battle_map, rng):
+    # Random legal player actions, with about a third of the units waiting instead; yields each action's kind
+    for unit in battle_map.units_of("player"):
+        if unit not in battle_map.positions or battle_map.winner is not None:
+            continue
+        if rng.random() < 0.35:
+            battle_map.wait_unit(unit)
+            yield "wait"
+            continue
+        x, y = battle_map.position_of(unit)
+        cells = sorted(battle_map.reachable_cells(x, y, unit.movement, "player"))
+        if cells:
+            x, y = rng.choice(cells)
+            battle_map.move_unit(unit, *battle_map.position_of(unit), x, y)
+            yield "move"
+        targets = battle_map.cells_in_range(x, y, unit.attack_range, "attack")
+        if targets:
+            battle_map.attack_unit(unit, x, y, *targets[0])
+            yield "attack"
+
+@pytest.mark.parametrize("name", ["basic_map", "forest_map", "desert_map"])
+def test_zobrist_follows_waits(name):
+    rng = random.Random(name)
+    battle_map = MAPS[name]()
+    waited = 0
+    for _ in range(20):
+        for action in play_player_turn(battle_map, rng):
+            waited += action == "wait"
+            assert battle_map.zobrist == battle_map.compute_zobrist()
+        if battle_map.winner is not None:
+            break
+        battle_map.end_turn()
+        assert battle_map.zobrist == battle_map.compute_zobrist()
+    assert waited
+
+def test_wait_rolls_back_exactly():
+    battle_map = MAPS["desert_map"]()
+    before, zobrist = table_state(battle_map), battle_map.zobrist
+    marker = battle_map.checkpoint()
+    for unit in battle_map.units_of("player"):
+        battle_map.wait_unit(unit)
+    assert all(unit.has_moved and unit.has_attacked for unit in battle_map.units_of("player"))
+    battle_map.rollback(marker)
+    battle_map.stop_journal()
+    assert battle_map.zobrist == zobrist == battle_map.compute_zobrist()
+    for old, new in zip(before, table_state(battle_map)):
+        assert np.array_equal(old, new)
+
+def test_waits_are_recorded_and_replayed():
+    battle_map = MAPS["forest_map"]()
+    recorder = ActionRecorder(battle_map)
+    rng = random.Random(3)
+    for _ in range(5):
+        list(play_player_turn(battle_map, rng))
+        if battle_map.winner is not None:
+            break
+        battle_map.end_turn()
+    replay = Replay(recorder.log)
+    assert snapshot(replay.run()) == snapshot(battle_map)
+
+def test_lookahead_mutes_only_its_own_thread():
+    set_level(logging.INFO)
+    try:
+        battle_map = MAPS["basic_map"]()
+        inside, started, done = threading.Event(), threading.Event(), threading.Event()
+        def search():
+            with battle_map.lookahead():
+                inside.set()
+                started.wait()
+                assert not logger.isEnabledFor(logging.INFO)
+            done.set()
+        worker = threading.Thread(target=search)
+        worker.start()
+        inside.wait()
+        assert logger.isEnabledFor(logging.INFO) # another thread's lookahead leaves this one logging
+        started.set()
+        worker.join()
+        assert done.is_set()
+    finally:
+        set_quiet()
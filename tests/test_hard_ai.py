@@ -0,0 +1,63 @@
+"""Hard_EnemyAI: legal actions within the time budget, searched without leaving a trace."""
+import time
+from functools import partial
+import numpy as np
+import pytest
+from battle_engine import distance
+from battle_maps import MAPS, generate_map
+from enemy_ai import Hard_EnemyAI
+from replay import snapshot
+
+BOARDS = {name: MAPS[name] for name in ("basic_map", "forest_map", "desert_map")}
+BOARDS["generated_16"] = partial(generate_map, 16, 16, seed=2)
+SLACK = 0.5 # seconds past the deadline allowed for the last search node and the fallback
+
+def enemy_phase(name, time_budget):
+    battle_map = BOARDS[name]()
+    battle_map.enemy_ai = Hard_EnemyAI(battle_map, time_budget=time_budget)
+    battle_map.start_enemy_turn()
+    return battle_map
+
+def board_state(battle_map):
+    return snapshot(battle_map), battle_map.zobrist, battle_map.unit_ids.copy(), battle_map.enemy_phase
+
+def assert_legal(battle_map, unit, action):
+    destination, kind, target, skill = action
+    start = battle_map.position_of(unit)
+    assert destination == start or destination in battle_map.reachable_cells(*start, unit.movement, unit.allegiance)
+    if kind is None:
+        return
+    occupant = battle_map.grid[target] if target != start else unit
+    assert occupant is not None
+    if kind == "attack":
+        assert occupant.allegiance != unit.allegiance and distance(*destination, *target) <= unit.attack_range
+    else:
+        assert skill in unit.skills and skill.turns_until_ready == 0
+        assert distance(*destination, *target) <= skill.range
+
+@pytest.mark.parametrize("name", sorted(BOARDS))
+def test_choose_action_is_legal_in_time_and_leaves_the_map_alone(name):
+    battle_map = enemy_phase(name, 0.2)
+    ai = battle_map.enemy_ai
+    before = board_state(battle_map)
+    pending = tuple(battle_map.units_of("enemy"))
+    started = time.perf_counter()
+    action = ai.choose_action(pending, started + 0.2)
+    assert time.perf_counter() - started < 0.2 + SLACK
+    assert action is not None and ai.nodes > 0
+    after = board_state(battle_map)
+    assert after[:2] == before[:2] and np.array_equal(after[2], before[2]) and after[3] == before[3]
+    assert battle_map.journal is None
+    assert_legal(battle_map, pending[0], action)
+    ai.play(pending[0], action)
+    assert battle_map.position_of(pending[0]) == action[0]
+    assert battle_map.zobrist == battle_map.compute_zobrist()
+
+@pytest.mark.parametrize("name", sorted(BOARDS))
+def test_turn_keeps_to_its_budget(name):
+    battle_map = enemy_phase(name, 0.3)
+    started = time.perf_counter()
+    battle_map.enemy_ai.execute_enemy_turn()
+    assert time.perf_counter() - started < 0.3 + SLACK
+    battle_map.finish_enemy_turn()
+    assert battle_map.zobrist == battle_map.compute_zobrist()
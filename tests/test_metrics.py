@@ -0,0 +1,15 @@
+"""TurnMetrics bookkeeping."""
+import pytest
+from metrics import TurnMetrics
+
+def test_merge_keeps_the_longest_call():
+    worker, live = TurnMetrics(), TurnMetrics()
+    for seconds in (0.1, 0.2, 0.3):
+        worker.add_time("enemy_ai", seconds, blocks=1)
+    live.add_time("enemy_ai", 0.05)
+    live.merge(worker)
+    stats = live.phases["enemy_ai"]
+    assert stats["calls"] == 4
+    assert stats["seconds"] == pytest.approx(0.65)
+    assert stats["max_seconds"] == pytest.approx(0.3)
+    assert stats["blocks"] == 3
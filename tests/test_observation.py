@@ -0,0 +1,46 @@
+"""ObservationEncoder against a cell-by-cell reference encoding."""
+import numpy as np
+import pytest
+from battle_maps import MAPS
+from observation import SCALES, ObservationEncoder
+
+def reference(encoder, battle_map):
+    # The observation built by walking the grid
+    out = encoder.empty()
+    index = encoder.index
+    out[index["passable"], :battle_map.rows, :battle_map.columns] = battle_map.passable
+    territory = index.get(f"territory:{battle_map.territory}")
+    if territory is not None:
+        out[territory] = 1
+    for unit, (x, y) in battle_map.positions.items():
+        out[index[f"occupancy:{unit.allegiance}"], x, y] = 1
+        out[index["hp"], x, y] = unit.hp / unit.max_hp
+        for stat in ("atk", "movement", "attack_range"):
+            out[index[stat], x, y] = getattr(unit, stat) / SCALES[stat]
+        out[index["has_moved"], x, y] = unit.has_moved
+        out[index["has_attacked"], x, y] = unit.has_attacked
+        for slot, skill in enumerate(unit.skills[:encoder.skill_slots]):
+            out[index[f"skill{slot}"], x, y] = 1 / (1 + skill.turns_until_ready)
+    return out
+
+def played(name, turns=3):
+    battle_map = MAPS[name]()
+    for _ in range(turns):
+        if battle_map.winner is None:
+            battle_map.end_turn()
+    return battle_map
+
+@pytest.mark.parametrize("skill_slots", [0, 1, 2])
+def test_encode_matches_reference(skill_slots):
+    encoder = ObservationEncoder(32, 32, skill_slots=skill_slots)
+    maps = [played(name) for name in ("basic_map", "forest_map", "desert_map", "generated_32")]
+    batch = encoder.encode_batch(maps)
+    assert batch.shape == (len(maps),) + encoder.shape
+    for battle_map, observation in zip(maps, batch):
+        expected = reference(encoder, battle_map)
+        assert np.allclose(encoder.encode(battle_map), expected)
+        assert np.allclose(observation, expected)
+
+def test_map_larger_than_encoder_is_rejected():
+    with pytest.raises(ValueError):
+        ObservationEncoder(4, 4).encode(MAPS["generated_32"]())
@@ -0,0 +1,69 @@
+"""Replay: seeking through keyframes lands on the same states as playing straight through."""
+import random
+import pytest
+from battle_maps import generate_map
+from enemy_ai import Easy_EnemyAI
+from replay import ActionLog, ActionRecorder, Replay, ReplayMismatch, TURN_ENDED, snapshot, state_digest
+
+def recorded_game(seed=0, max_turns=40):
+    # An AI-vs-AI game and the digest of its position at the start of every turn
+    battle_map = generate_map(16, 16, seed=seed)
+    battle_map.enemy_ai = Easy_EnemyAI(battle_map, rng=random.Random(1))
+    player = Easy_EnemyAI(battle_map, "player", rng=random.Random(2))
+    recorder = ActionRecorder(battle_map)
+    digests = {battle_map.turn: state_digest(battle_map)}
+    while battle_map.winner is None and battle_map.turn < max_turns:
+        player.execute_enemy_turn()
+        if battle_map.winner is not None:
+            break
+        battle_map.end_turn()
+        digests[battle_map.turn] = state_digest(battle_map)
+    return battle_map, recorder.log, digests
+
+@pytest.fixture(scope="module")
+def game():
+    return recorded_game()
+
+def test_straight_replay_matches_the_game(game):
+    battle_map, log, digests = game
+    assert battle_map.winner is not None and len(digests) > 6
+    replay = Replay(log, keyframe_interval=3)
+    assert snapshot(replay.run()) == snapshot(battle_map)
+    assert state_digest(replay.battle_map) == state_digest(battle_map)
+    assert sorted(replay.keyframes) == [turn for turn in sorted(digests) if turn == 1 or turn % 3 == 0]
+
+def test_seek_matches_straight_play(game):
+    _, log, digests = game
+    replay = Replay(log, keyframe_interval=3)
+    turns = sorted(digests)
+    for turn in turns: # forwards before any keyframe past turn 1 exists
+        assert state_digest(replay.seek(turn)) == digests[turn]
+    for turn in reversed(turns): # backwards, restoring from keyframes
+        assert state_digest(replay.seek(turn)) == digests[turn]
+    for turn in random.Random(0).sample(turns, len(turns)):
+        assert state_digest(replay.seek(turn)) == digests[turn]
+
+def test_keyframes_are_independent_of_the_replayed_map(game):
+    _, log, digests = game
+    replay = Replay(log, keyframe_interval=2)
+    last = max(digests)
+    replay.seek(last)
+    restored = replay.seek(2) # from the turn 2 keyframe
+    assert state_digest(restored) == digests[2]
+    assert state_digest(replay.seek(last)) == digests[last]
+
+def test_saved_log_replays_the_same(game, tmp_path):
+    battle_map, log, digests = game
+    log.save(tmp_path / "game.slglog")
+    replay = Replay(ActionLog.load(tmp_path / "game.slglog"), keyframe_interval=4)
+    assert state_digest(replay.seek(max(digests))) == digests[max(digests)]
+    assert snapshot(replay.run()) == snapshot(battle_map)
+
+def test_tampered_digest_is_caught(game):
+    _, log, _ = game
+    rows = log.array().copy()
+    ends = [index for index, row in enumerate(rows.tolist()) if row[0] == TURN_ENDED]
+    rows[ends[1], 2] += 1
+    replay = Replay(ActionLog(log.start, log.seed, log.units, rows))
+    with pytest.raises(ReplayMismatch):
+        replay.run()
@@ -0,0 +1,76 @@
+"""Save/load round trips through every loading path."""
+import io
+import random
+import pytest
+from battle_engine import BattleMap, Unit
+from enemy_ai import Easy_EnemyAI, Hard_EnemyAI
+from replay import snapshot
+from savegame import HEADER, SaveFormatError, copy_battle, load_battle, save_battle
+from units import GOBLIN, HEALER, KNIGHT
+
+def skirmish(goblins, ai_policy=None):
+    # A healer that has just burned a goblin with Fire Ball, so the skill is on cooldown
+    battle_map = BattleMap(5, 5, ai_policy=ai_policy)
+    healer = Unit.from_template(HEALER, "Healer", allegiance="player")
+    battle_map.add_unit(healer, 0, 0)
+    battle_map.add_unit(Unit.from_template(KNIGHT, "Knight", allegiance="player"), 1, 0)
+    for x, y in goblins:
+        battle_map.add_unit(Unit.from_template(GOBLIN, "Goblin", allegiance="enemy"), x, y)
+    fireball = healer.skills[0]
+    assert battle_map.use_skill(healer, fireball, 0, 0, *goblins[0])
+    assert fireball.turns_until_ready > 0
+    return battle_map
+
+def round_trip(battle_map, path, how):
+    if how == "stream":
+        buffer = io.BytesIO()
+        save_battle(battle_map, buffer)
+        buffer.seek(0)
+        return load_battle(buffer)
+    save_battle(battle_map, path)
+    return load_battle(path, use_mmap=how == "mmap")
+
+def cooldowns(battle_map):
+    return battle_map.skill_table.turns_until_ready[:battle_map.skill_table.size].tolist()
+
+@pytest.mark.parametrize("how", ["stream", "file", "mmap"])
+def test_round_trip_keeps_policy_phase_and_cooldowns(tmp_path, how):
+    battle_map = skirmish([(0, 2), (4, 4)], ai_policy=Hard_EnemyAI)
+    battle_map.start_enemy_turn()
+    loaded = round_trip(battle_map, tmp_path / "battle.sav", how)
+    assert type(loaded.enemy_ai) is Hard_EnemyAI and loaded.enemy_ai.battle_map is loaded
+    assert loaded.enemy_phase and loaded.winner is None
+    assert loaded.zobrist == loaded.compute_zobrist() # dead units are not saved, so row indices may differ
+    assert cooldowns(loaded) == cooldowns(battle_map) and max(cooldowns(loaded)) > 0
+    assert snapshot(loaded) == snapshot(battle_map)
+    loaded.finish_enemy_turn() # the loaded map plays on from where it stopped
+    assert not loaded.enemy_phase and loaded.zobrist == loaded.compute_zobrist()
+
+@pytest.mark.parametrize("how", ["stream", "file", "mmap"])
+def test_round_trip_keeps_winner(tmp_path, how):
+    battle_map = skirmish([(0, 2)])
+    assert battle_map.winner == "player"
+    loaded = round_trip(battle_map, tmp_path / "battle.sav", how)
+    assert loaded.winner == "player" and not loaded.enemy_phase
+    assert type(loaded.enemy_ai) is Easy_EnemyAI
+    assert snapshot(loaded) == snapshot(battle_map)
+
+def test_rejects_unknown_version():
+    buffer = io.BytesIO()
+    save_battle(skirmish([(0, 2), (4, 4)]), buffer)
+    data = bytearray(buffer.getvalue())
+    magic, _, reserved, size = HEADER.unpack_from(data)
+    HEADER.pack_into(data, 0, magic, 99, reserved, size)
+    with pytest.raises(SaveFormatError):
+        load_battle(io.BytesIO(bytes(data)))
+
+def test_copy_battle_gives_the_ai_its_own_state():
+    battle_map = skirmish([(0, 2), (4, 4)])
+    battle_map.enemy_ai = Hard_EnemyAI(battle_map, rng=random.Random(7))
+    battle_map.enemy_ai.transpositions[battle_map.zobrist] = "entry"
+    copy = copy_battle(battle_map)
+    original, ai = battle_map.enemy_ai, copy.enemy_ai
+    assert ai.battle_map is copy and ai.time_budget == original.time_budget
+    assert ai.rng is not original.rng and ai.transpositions == {}
+    draws = [ai.rng.random() for _ in range(3)]
+    assert draws == [original.rng.random() for _ in range(3)] # same choices, drawn independently
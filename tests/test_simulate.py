@@ -0,0 +1,25 @@
+"""simulate() and play_game(): the same seed always plays the same games."""
+from functools import partial
+from battle_maps import MAPS, generate_map
+from enemy_ai import Easy_EnemyAI
+from simulate import play_game, simulate
+
+small_map = partial(generate_map, 10, 10)
+
+def test_play_game_is_deterministic_for_a_seed():
+    for seed in (None, 0, 5):
+        first = play_game(small_map, seed=seed, vary_maps=True)
+        assert play_game(small_map, seed=seed, vary_maps=True) == first
+
+def test_seeds_vary_generated_maps():
+    digests = {play_game(small_map, seed=seed, vary_maps=True)["digest"] for seed in range(4)}
+    assert len(digests) > 1
+
+def test_simulate_is_deterministic_for_a_seed():
+    run = partial(simulate, MAPS["desert_map"], Easy_EnemyAI, Easy_EnemyAI, games=12, seed=3)
+    report = run(processes=1)
+    assert run(processes=1) == report
+    assert report["games"] == 12 and report["distinct_games"] > 1
+    # Game i is always seeded with seed + i, however the games are split up
+    assert run(processes=1, batch_size=5) == report
+    assert run(processes=2, batch_size=4) == report
@@ -0,0 +1,95 @@
+"""ThreatMap: the incrementally kept map always equals one built from scratch."""
+import random
+from functools import partial
+import numpy as np
+import pytest
+from battle_engine import BattleMap, BattleObserver, Unit, distance
+from battle_maps import MAPS, generate_map
+from enemy_ai import Easy_EnemyAI
+from threat import ThreatMap
+from units import HEALER, ORC
+
+def brute_danger(battle_map, allegiance):
+    # Per cell, the summed best damage of every unit not on `allegiance`'s side, by the definition
+    danger = np.zeros((battle_map.rows, battle_map.columns), dtype=np.int64)
+    for unit, (x, y) in battle_map.positions.items():
+        if unit.allegiance == allegiance:
+            continue
+        weapons = [(unit.attack_range, unit.atk)] + [(skill.range, skill.damage) for skill in unit.skills
+                                                     if skill.effect_type == "attack" and skill.turns_until_ready == 0]
+        for cx in range(battle_map.rows):
+            for cy in range(battle_map.columns):
+                gap = distance(x, y, cx, cy)
+                danger[cx, cy] += max([damage for reach, damage in weapons if gap <= unit.movement + reach], default=0)
+    return danger
+
+class Checker(BattleObserver):
+    """Compares the threat map with the brute-force one after every action."""
+
+    def __init__(self, threats):
+        self.threats = threats
+        self.blocks = []
+        self.previous = threats.total.copy()
+        self.checked = 0
+        self.defeated = []
+
+    def on_unit_defeated(self, battle_map, unit, x, y):
+        self.defeated.append(unit)
+
+    def on_changes(self, battle_map, changes):
+        threats = self.threats
+        for side in ("player", "enemy"):
+            expected = brute_danger(battle_map, side)
+            assert np.array_equal(threats.danger(side), expected)
+            x, y = battle_map.rows // 2, battle_map.columns // 2
+            assert threats.danger_at(side, x, y) == expected[x, y]
+        # Every cell whose threat changed lies in a block passed to on_update
+        covered = np.zeros(threats.total.shape, dtype=np.bool_)
+        for first_row, last_row, first_col, last_col in self.blocks:
+            covered[first_row:last_row, first_col:last_col] = True
+        assert not (threats.total != self.previous)[~covered].any()
+        self.blocks.clear()
+        self.previous = threats.total.copy()
+        self.checked += 1
+
+BOARDS = {"desert_map": MAPS["desert_map"], "forest_map": MAPS["forest_map"],
+          "generated_12": partial(generate_map, 12, 12, seed=3)}
+
+@pytest.mark.parametrize("name", sorted(BOARDS))
+def test_threat_map_follows_a_game(name):
+    battle_map = BOARDS[name]()
+    battle_map.enemy_ai = Easy_EnemyAI(battle_map, rng=random.Random(1))
+    player = Easy_EnemyAI(battle_map, "player", rng=random.Random(2))
+    threats = ThreatMap(battle_map)
+    checker = Checker(threats)
+    threats.on_update = checker.blocks.extend
+    battle_map.add_observer(checker) # after the threat map, so it sees the updated arrays
+    while battle_map.winner is None and battle_map.turn < 30:
+        player.execute_enemy_turn()
+        if battle_map.winner is not None:
+            break
+        battle_map.end_turn()
+    assert checker.checked > 10 and checker.defeated
+    assert not any(unit in threats.placed for unit in checker.defeated)
+    for side in ("player", "enemy"):
+        assert np.array_equal(threats.danger(side), ThreatMap(battle_map, attach=False).danger(side))
+
+def test_threat_follows_skill_cooldowns():
+    battle_map = BattleMap(7, 7)
+    healer = Unit.from_template(HEALER, "Healer", allegiance="player")
+    battle_map.add_unit(healer, 0, 0)
+    battle_map.add_unit(Unit.from_template(ORC, "Orc", allegiance="enemy"), 0, 3)
+    threats = ThreatMap(battle_map)
+    checker = Checker(threats)
+    threats.on_update = checker.blocks.extend
+    battle_map.add_observer(checker)
+    ready = threats.danger("enemy")
+    fireball = healer.skills[0]
+    assert battle_map.use_skill(healer, fireball, 0, 0, 0, 3)
+    assert fireball.turns_until_ready > 0 and (threats.danger("enemy") < ready).any() # out of Fire Ball's reach
+    for _ in range(fireball.cooldown): # turns in which the enemy does nothing
+        battle_map.start_enemy_turn()
+        battle_map.finish_enemy_turn()
+    assert fireball.turns_until_ready == 0
+    assert threats.weapons(healer) == tuple(sorted([(healer.attack_range, healer.atk), (fireball.range, fireball.damage)]))
+    assert checker.checked > 3
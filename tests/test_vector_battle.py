@@ -0,0 +1,71 @@
+"""VectorBattle: stepping, rewards and restarting finished battles."""
+import numpy as np
+from battle_engine import BattleMap, Unit
+from battle_maps import MAPS
+from replay import ATTACK, END_TURN, MOVE
+from units import GOBLIN, KNIGHT
+from vector_battle import WIN_REWARD, VectorBattle
+
+def duel():
+    # A knight next to a goblin: three attacks, with enemy turns in between, win the battle
+    battle_map = BattleMap(3, 3)
+    battle_map.add_unit(Unit.from_template(KNIGHT, "Knight", allegiance="player"), 0, 0)
+    battle_map.add_unit(Unit.from_template(GOBLIN, "Goblin", allegiance="enemy"), 0, 1)
+    return battle_map
+
+ATTACK_GOBLIN = (ATTACK, 0, 0, 0, 1, 0)
+PASS = (END_TURN, 0, 0, 0, 0, 0)
+
+def test_reset_and_step():
+    battles = VectorBattle(MAPS["forest_map"], 3)
+    start = battles.reset()
+    assert start.shape == (3,) + battles.observation_shape and start.dtype == np.float32
+    assert (start == start[0]).all()
+    destination = sorted(MAPS["forest_map"]().reachable_cells(1, 1, 3, "player"))[0]
+    actions = [(MOVE, 1, 1, *destination, 0), (MOVE, 0, 0, 1, 0, 0), PASS] # the middle one moves from an empty cell
+    observations, rewards, dones, infos = battles.step(actions)
+    assert [info["valid"] for info in infos] == [True, False, True]
+    assert not dones.any() and rewards[0] == rewards[1] == 0
+    assert (observations[1] == start[1]).all() and (observations[0] != start[0]).any() # the invalid action changed nothing
+    assert battles.group.battles[0].grid[destination].name == "Archer"
+    assert battles.group.battles[2].turn == 2
+
+def test_finished_battle_restarts():
+    battles = VectorBattle(duel, 2)
+    start = battles.reset()
+    plan = [ATTACK_GOBLIN, PASS, ATTACK_GOBLIN, PASS]
+    for row in plan:
+        _, _, dones, _ = battles.step([row, PASS])
+        assert not dones.any()
+    observations, rewards, dones, infos = battles.step([ATTACK_GOBLIN, PASS])
+    assert dones.tolist() == [True, False]
+    assert infos[0]["winner"] == "player" and infos[0]["turns"] == 3
+    assert rewards[0] > WIN_REWARD # the last hit's damage on top of the win
+    assert (observations[0] == start[0]).all() and battles.group.battles[0].turn == 1
+    assert battles.group.battles[0].winner is None
+
+def test_max_turns_ends_a_battle():
+    battles = VectorBattle(MAPS["desert_map"], 1, max_turns=2)
+    start = battles.reset()
+    for _ in range(2):
+        observations, _, dones, infos = battles.step([PASS])
+    assert dones.tolist() == [True] and infos[0]["winner"] is None and infos[0]["turns"] == 3
+    assert (observations == start).all()
+
+def test_worker_processes_match_one_process():
+    plan = [[ATTACK_GOBLIN, PASS, ATTACK_GOBLIN], [PASS, ATTACK_GOBLIN, PASS], [ATTACK_GOBLIN, PASS, PASS]] * 2
+    results = []
+    for processes in (1, 2):
+        battles = VectorBattle(duel, 3, processes=processes)
+        try:
+            steps = [battles.reset()]
+            for actions in plan:
+                steps.append(battles.step(actions))
+        finally:
+            battles.close()
+        results.append(steps)
+    single, split = results
+    assert (single[0] == split[0]).all()
+    for (obs_a, rewards_a, dones_a, infos_a), (obs_b, rewards_b, dones_b, infos_b) in zip(single[1:], split[1:]):
+        assert (obs_a == obs_b).all() and (rewards_a == rewards_b).all() and (dones_a == dones_b).all()
+        assert infos_a == infos_b
@@ -0,0 +1,127 @@
+"""Per-side threat maps: how much damage could reach each cell next turn.
+
+ThreatMap keeps one integer array per allegiance. A unit adds its best
+damage to every cell within its movement plus the range of each weapon it
+has: its attack and its attack skills that are ready. Where several weapons
+reach a cell the strongest counts, since a unit acts once per turn. Distances
+are Manhattan, like every range check in the engine, so walls and blocking
+units are ignored and the map is an upper bound on the real threat.
+
+The map follows the board through on_changes: only units an action added,
+moved or removed, or whose attack skills came off or went on cooldown, are
+taken out and put back in, so an action costs a few small array slices
+however many units are on the board. Looking up the danger to a cell is
+then an array read:
+
+    threats = ThreatMap(battle_map)
+    threats.danger_at("enemy", x, y) # damage the player's units could deal there
+"""
+from functools import lru_cache
+import numpy as np
+from battle_engine import BattleObserver
+
+@lru_cache(maxsize=None)
+def footprint(movement, weapons):
+    """Square patch centred on the unit: the most damage any (range, damage) weapon deals to each cell."""
+    reach = movement + max(attack_range for attack_range, _ in weapons)
+    span = np.abs(np.arange(-reach, reach + 1))
+    steps = span[:, None] + span[None, :]
+    patch = np.zeros(steps.shape, dtype=np.int64)
+    for attack_range, damage in weapons:
+        np.maximum(patch, np.where(steps <= movement + attack_range, damage, 0), out=patch)
+    patch.setflags(write=False)
+    return patch
+
+class ThreatMap(BattleObserver):
+    """Threat per allegiance, kept in step with a BattleMap.
+
+    `threat[side]` is the summed threat of that side's units and `total` the
+    sum over every side. on_update, if given, is called after each change
+    with the (first_row, last_row, first_col, last_col) blocks that changed,
+    so a view can repaint just those.
+    """
+
+    def __init__(self, battle_map, on_update=None, attach=True):
+        self.battle_map = battle_map
+        self.on_update = on_update
+        self.threat = {}
+        self.total = np.zeros((battle_map.rows, battle_map.columns), dtype=np.int64)
+        self.placed = {} # unit -> (side, block, patch, weapons) it currently contributes
+        for unit in battle_map.positions:
+            self.place(unit)
+        if attach:
+            battle_map.add_observer(self)
+
+    def detach(self):
+        self.battle_map.remove_observer(self)
+
+    def weapons(self, unit):
+        # (range, damage) of the unit's attack and of its ready attack skills
+        weapons = [(unit.attack_range, unit.atk)]
+        weapons.extend((skill.range, skill.damage) for skill in unit.skills
+                       if skill.effect_type == "attack" and skill.turns_until_ready == 0)
+        return tuple(sorted(weapons))
+
+    def place(self, unit):
+        # Add the unit's footprint to its side's threat, clipped to the board
+        x, y = self.battle_map.positions[unit]
+        weapons = self.weapons(unit)
+        patch = footprint(unit.movement, weapons)
+        reach = patch.shape[0] // 2
+        rows, columns = self.total.shape
+        first_row, last_row = max(x - reach, 0), min(x + reach + 1, rows)
+        first_col, last_col = max(y - reach, 0), min(y + reach + 1, columns)
+        patch = patch[first_row - x + reach:last_row - x + reach, first_col - y + reach:last_col - y + reach]
+        side = unit.allegiance
+        if side not in self.threat:
+            self.threat[side] = np.zeros_like(self.total)
+        block = (slice(first_row, last_row), slice(first_col, last_col))
+        self.threat[side][block] += patch
+        self.total[block] += patch
+        self.placed[unit] = (side, block, patch, weapons)
+        return first_row, last_row, first_col, last_col
+
+    def lift(self, unit):
+        # Take back what place() added
+        side, block, patch, _ = self.placed.pop(unit)
+        self.threat[side][block] -= patch
+        self.total[block] -= patch
+        return block[0].start, block[0].stop, block[1].start, block[1].stop
+
+    def refresh(self, units):
+        # Re-place each unit as it stands now, dropping the ones that left the board
+        blocks = []
+        for unit in units:
+            if unit in self.placed:
+                blocks.append(self.lift(unit))
+            if unit in self.battle_map.positions:
+                blocks.append(self.place(unit))
+        return blocks
+
+    def on_changes(self, battle_map, changes):
+        units = changes.added | changes.moved.keys() | changes.removed
+        if changes.cooldowns:
+            # Only a skill becoming ready or unready changes its owner's weapons
+            owners = battle_map.skill_table.owner[list(changes.cooldowns)]
+            for owner in set(owners.tolist()):
+                unit = battle_map.unit_table.objects[owner]
+                if unit in self.placed and self.placed[unit][3] != self.weapons(unit):
+                    units.add(unit)
+        blocks = self.refresh(units)
+        if blocks and self.on_update is not None:
+            self.on_update(blocks)
+
+    def threat_at(self, allegiance, x, y):
+        # Damage the units of `allegiance` could deal at (x, y)
+        side = self.threat.get(allegiance)
+        return 0 if side is None else side.item(x, y)
+
+    def danger_at(self, allegiance, x, y):
+        # Damage every other side could deal to a unit of `allegiance` at (x, y)
+        return self.total.item(x, y) - self.threat_at(allegiance, x, y)
+
+    def danger(self, allegiance, rows=slice(None), columns=slice(None)):
+        """danger_at as an array, for every cell or for a block of rows and columns."""
+        side = self.threat.get(allegiance)
+        total = self.total[rows, columns]
+        return total.copy() if side is None else total - side[rows, columns]
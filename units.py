@@ -0,0 +1,13 @@
+from battle_engine import UnitTemplate
+from skills import FIREBALL, HEAL
+
+# Shared unit types. Base stats and skill definitions are stored once per type;
+# Unit.from_template only allocates the per-unit state (hp, flags, cooldowns).
+KNIGHT = UnitTemplate("Knight", 100, 20, 2, 1)
+GOBLIN = UnitTemplate("Goblin", 50, 10, 2, 1)
+ARCHER = UnitTemplate("Archer", 80, 15, 3, 2)
+SWORDSMAN = UnitTemplate("Swordsman", 100, 20, 2, 1)
+ORC = UnitTemplate("Orc", 120, 25, 2, 1)
+CAVALRY = UnitTemplate("Cavalry", 120, 30, 4, 1)
+HEALER = UnitTemplate("Healer", 60, 20, 2, 3, skills=(FIREBALL, HEAL))
+SAND_RAIDER = UnitTemplate("Sand Raider", 70, 15, 3, 1)
@@ -0,0 +1,179 @@
+"""Many independent battles stepped in lockstep, for training and bulk balancing.
+
+VectorBattle holds K battles built from battle_maps factories and steps all
+of them with one call:
+
+    battles = VectorBattle(MAPS["desert_map"], 64)
+    observations = battles.reset()
+    observations, rewards, dones, infos = battles.step(actions)
+
+actions is a (K, 6) integer array with one replay row per battle (see
+replay.py): MOVE, ATTACK or SKILL for a player unit, or END_TURN, which lets
+the enemy policy play its whole turn. Observations are stacked into one
+(K, channels, rows, columns) float32 array laid out by ObservationEncoder
+(see observation.py), zero-padded when the factories build maps of
+different sizes; `encoder.channels` names the channels. The reward is the HP the enemy lost minus the
+HP the player lost during the step, as a fraction of the HP both sides
+started with, plus WIN_REWARD for a won battle and minus it for a lost one.
+A battle that is won, lost or past max_turns is done: its final state goes
+into infos and it restarts from its start position in the same call.
+
+With processes > 1 the battles are split between worker processes that each
+step their share, so one step uses that many cores.
+"""
+import io
+import multiprocessing
+import numpy as np
+from battle_engine import allegiance_code
+from battle_log import muted, set_quiet
+from enemy_ai import Easy_EnemyAI
+from observation import ObservationEncoder
+from replay import ATTACK, END_TURN, MOVE, SKILL, snapshot
+from savegame import load_battle
+
+WIN_REWARD = 1.0
+
+def side_hp(battle_map):
+    # Total HP left on the player's and on the enemy's side
+    table = battle_map.unit_table
+    live = table.alive[:table.size]
+    hp = np.maximum(table.hp[:table.size], 0)
+    player = table.allegiance[:table.size] == allegiance_code("player")
+    return int(hp[live & player].sum()), int(hp[live & ~player].sum())
+
+class BattleGroup:
+    """Battles stepped one after another in this process; VectorBattle's unit of work."""
+
+    def __init__(self, factories, enemy_policy=Easy_EnemyAI, max_turns=200):
+        self.starts = [snapshot(factory()) for factory in factories]
+        self.enemy_policy = enemy_policy
+        self.max_turns = max_turns
+        self.battles = [None] * len(self.starts)
+        self.start_hp = [0] * len(self.starts)
+        first = [load_battle(io.BytesIO(start)) for start in self.starts]
+        self.encoder = ObservationEncoder(max(battle.rows for battle in first), max(battle.columns for battle in first))
+        self.shape = (len(self.starts),) + self.encoder.shape
+
+    def restart(self, index):
+        battle_map = load_battle(io.BytesIO(self.starts[index]))
+        battle_map.enemy_ai = self.enemy_policy(battle_map)
+        self.battles[index] = battle_map
+        self.start_hp[index] = sum(side_hp(battle_map)) or 1
+
+    def reset(self):
+        for index in range(len(self.battles)):
+            self.restart(index)
+        return self.observations()
+
+    def observations(self):
+        return self.encoder.encode_batch(self.battles)
+
+    def act(self, battle_map, row):
+        # Carry out one action row; returns whether it changed the battle
+        kind, x, y, a, b, c = row
+        before = battle_map.zobrist
+        unit = battle_map.grid[x, y] if 0 <= x < battle_map.rows and 0 <= y < battle_map.columns else None
+        if kind == END_TURN:
+            battle_map.end_turn()
+        elif unit is None or unit.allegiance != "player":
+            return False
+        elif kind == MOVE:
+            battle_map.move_unit(unit, x, y, a, b)
+        elif kind == ATTACK:
+            battle_map.attack_unit(unit, x, y, a, b)
+        elif kind == SKILL and 0 <= a < len(unit.skills) and 0 <= b < battle_map.rows and 0 <= c < battle_map.columns:
+            battle_map.use_skill(unit, unit.skills[a], x, y, b, c)
+        return battle_map.zobrist != before
+
+    def step(self, actions):
+        count = len(self.battles)
+        rewards = np.zeros(count, dtype=np.float32)
+        dones = np.zeros(count, dtype=np.bool_)
+        infos = [{} for _ in range(count)]
+        with muted(): # invalid actions would log a warning each
+            for index, (battle_map, row) in enumerate(zip(self.battles, np.asarray(actions).tolist())):
+                player_before, enemy_before = side_hp(battle_map)
+                infos[index]["valid"] = self.act(battle_map, row)
+                player_after, enemy_after = side_hp(battle_map)
+                rewards[index] = ((enemy_before - enemy_after) - (player_before - player_after)) / self.start_hp[index]
+                if battle_map.winner is not None:
+                    rewards[index] += WIN_REWARD if battle_map.winner == "player" else -WIN_REWARD
+                if battle_map.winner is not None or battle_map.turn > self.max_turns:
+                    dones[index] = True
+                    infos[index].update(winner=battle_map.winner, turns=battle_map.turn)
+                    self.restart(index)
+        return self.observations(), rewards, dones, infos
+
+def serve(connection, factories, enemy_policy, max_turns):
+    # Worker process: own a BattleGroup and answer the parent's commands until told to close
+    set_quiet()
+    group = BattleGroup(factories, enemy_policy, max_turns)
+    connection.send(group.shape)
+    while True:
+        command, data = connection.recv()
+        if command == "close":
+            break
+        connection.send(group.reset() if command == "reset" else group.step(data))
+    connection.close()
+
+class VectorBattle:
+    """K battles stepped together; see the module docstring.
+
+    factory is one battle_maps factory for every battle or a list of K of
+    them. enemy_policy is the AI class that plays END_TURN.
+    """
+
+    def __init__(self, factory, count=None, enemy_policy=Easy_EnemyAI, max_turns=200, processes=1):
+        factories = list(factory) if count is None else [factory] * count
+        self.count = len(factories)
+        processes = max(1, min(processes or multiprocessing.cpu_count(), self.count))
+        bounds = np.linspace(0, self.count, processes + 1).astype(int)
+        self.slices = [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        self.group = None
+        self.workers = []
+        if processes == 1:
+            self.group = BattleGroup(factories, enemy_policy, max_turns)
+            shapes = [self.group.shape]
+        else:
+            for part in self.slices:
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=serve, args=(child, factories[part], enemy_policy, max_turns), daemon=True)
+                process.start()
+                self.workers.append((parent, process))
+            shapes = [connection.recv() for connection, _ in self.workers]
+        self.encoder = ObservationEncoder(max(shape[2] for shape in shapes), max(shape[3] for shape in shapes))
+        self.observation_shape = self.encoder.shape
+
+    def gather(self, parts):
+        # Stack the workers' observations, padding smaller maps, and join their other results
+        observations = np.zeros((self.count,) + self.observation_shape, dtype=np.float32)
+        for part, piece in zip(self.slices, parts):
+            block = piece if isinstance(piece, np.ndarray) else piece[0]
+            observations[part, :, :block.shape[2], :block.shape[3]] = block
+        return observations
+
+    def reset(self):
+        """Restart every battle and return the observations."""
+        if self.group is not None:
+            return self.gather([self.group.reset()])
+        for connection, _ in self.workers:
+            connection.send(("reset", None))
+        return self.gather([connection.recv() for connection, _ in self.workers])
+
+    def step(self, actions):
+        """Apply one action row per battle; returns (observations, rewards, dones, infos)."""
+        actions = np.asarray(actions, dtype=np.int64).reshape(self.count, -1)
+        if self.group is not None:
+            parts = [self.group.step(actions)]
+        else:
+            for (connection, _), part in zip(self.workers, self.slices):
+                connection.send(("step", actions[part]))
+            parts = [connection.recv() for connection, _ in self.workers]
+        return (self.gather(parts), np.concatenate([part[1] for part in parts]),
+                np.concatenate([part[2] for part in parts]), [info for part in parts for info in part[3]])
+
+    def close(self):
+        for connection, process in self.workers:
+            connection.send(("close", None))
+            process.join()
+        self.workers = []